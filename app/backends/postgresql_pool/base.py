@@ -0,0 +1,146 @@
+"""
+PostgreSQL backend that takes its connections from a psycopg_pool.ConnectionPool.
+
+Django opens a connection per request (CONN_MAX_AGE = 0) and closes it at the
+end. With this backend opening takes an idle connection from the pool and
+closing gives it back, so requests skip the connection setup and
+authentication. Pool options come from the POOL key of the database settings,
+e.g. {'min_size': 2, 'max_size': 10, 'timeout': 10}, and the parameters in
+SESSION_PARAMETERS are set once on every new connection of the pool.
+
+The pools of a test database are closed before it is dropped, and Django's
+connections to the maintenance database are not pooled.
+
+The pool is thread-safe and created lazily once per process, which covers WSGI
+workers, ASGI servers (where the ORM runs in threads) and forked workers.
+"""
+
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool
+
+# (process id, alias, connection parameters) -> ConnectionPool
+pools = {}
+pools_lock = threading.Lock()
+
+
+def close_pools(dbname):
+    """Close the pools of this process connected to the database."""
+    with pools_lock:
+        for key, pool in list(pools.items()):
+            if pool.kwargs.get('dbname') == dbname:
+                pool.close()
+                del pools[key]
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # The pool keeps min_size connections open, which DROP DATABASE refuses.
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def pool_key(self, conn_params):
+        # The adapters context is rebuilt for every connection, it is not
+        # part of what identifies the server and the credentials.
+        params = sorted(
+            (key, repr(value)) for key, value in conn_params.items() if key != 'context'
+        )
+        return os.getpid(), self.alias, tuple(params)
+
+    def get_pool(self, conn_params):
+        key = self.pool_key(conn_params)
+        pool = pools.get(key)
+        if pool is None:
+            with pools_lock:
+                pool = pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        kwargs=conn_params,
+                        name=self.alias,
+                        # Checked out connections are tested with a round trip
+                        # and replaced if the server closed them.
+                        check=ConnectionPool.check_connection,
+                        configure=self.configure_connection,
+                        open=True,
+                        **self.settings_dict.get('POOL', {}),
+                    )
+                    pools[key] = pool
+        return pool
+
+    def configure_connection(self, connection):
+        """Set the SESSION_PARAMETERS on a new connection of the pool."""
+        parameters = self.settings_dict.get('SESSION_PARAMETERS', {})
+        if not parameters:
+            return
+        with connection.cursor() as cursor:
+            for name, value in parameters.items():
+                cursor.execute('SELECT set_config(%s, %s, false)', [name, value])
+        # The pool takes connections back only outside of a transaction.
+        connection.commit()
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            # Creates and drops the test databases, not pooled.
+            self.pool_key_in_use = None
+            return super().get_new_connection(conn_params)
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = IsolationLevel(
+                options.get('isolation_level', IsolationLevel.READ_COMMITTED)
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {options['isolation_level']} "
+                f"specified. Use one of the psycopg.IsolationLevel values."
+            )
+
+        self.pool_key_in_use = self.pool_key(conn_params)
+        connection = self.get_pool(conn_params).getconn()
+        if 'isolation_level' in options:
+            connection.isolation_level = self.isolation_level
+        connection.cursor_factory = (
+            base.ServerBindingCursor
+            if options.get('server_side_binding') is True
+            else base.Cursor
+        )
+        return connection
+
+    def _close(self):
+        """Give the connection back to the pool instead of closing it."""
+        if self.connection is None:
+            return
+        pool = pools.get(getattr(self, 'pool_key_in_use', None))
+        with self.wrap_database_errors:
+            if pool is None:
+                return self.connection.close()
+            # Connections left in a transaction are rolled back, broken ones
+            # are discarded by the pool.
+            pool.putconn(self.connection)
+
+
+def pool_stats():
+    """
+    Statistics of the pools of this process by database alias: size, connections
+    in use and idle, waiting requests, wait times, timeouts and errors.
+    """
+    stats = {}
+    for (pid, alias, _), pool in list(pools.items()):
+        if pid != os.getpid():
+            continue
+        pool_stats = pool.get_stats()
+        pool_stats['connections_in_use'] = pool_stats.get(
+            'pool_size', 0
+        ) - pool_stats.get('pool_available', 0)
+        stats[alias] = pool_stats
+    return stats
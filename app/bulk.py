@@ -0,0 +1,160 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .closure import CLOSURE_TABLES, defer_closure_removals
+from .representations import CachedListSerializer
+from .signals import bulk_changed, bulk_deleted_pks
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key relation that resolves against objects loaded by BulkListSerializer.
+
+    A plain PrimaryKeyRelatedField runs one SELECT per value. In a list request the
+    related objects of all items are fetched up front, one query per related model.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded_objects', {}).get(
+            self.get_queryset().model
+        )
+        if preloaded is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[str(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BulkListSerializer(CachedListSerializer):
+    """
+    List serializer that writes a whole request with a fixed number of queries.
+
+    Related objects are loaded with one query per related model, new rows are
+    inserted with bulk_create, changed rows are written with bulk_update and the
+    many-to-many values of all items with one insert per field. Reads go
+    through the representation cache.
+    """
+
+    def relation_fields(self):
+        """Primary key relation fields of the child serializer by field name."""
+        fields = {}
+        for field_name, field in self.child.fields.items():
+            if field.read_only:
+                continue
+            if isinstance(field, serializers.ManyRelatedField):
+                fields[field_name] = (field.child_relation, True)
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                fields[field_name] = (field, False)
+        return fields
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.preload_related_objects(data)
+        return super().to_internal_value(data)
+
+    def preload_related_objects(self, data):
+        """Fetch the objects all items refer to, one in_bulk() per related model."""
+        pks_by_queryset = {}
+        for field_name, (field, many) in self.relation_fields().items():
+            queryset = field.get_queryset()
+            pks = pks_by_queryset.setdefault(queryset.model, (queryset, set()))[1]
+            for item in data:
+                if not isinstance(item, dict) or item.get(field_name) is None:
+                    continue
+                values = item[field_name] if many else [item[field_name]]
+                if isinstance(values, list):
+                    pks.update(
+                        str(value)
+                        for value in values
+                        if isinstance(value, (str, int)) and not isinstance(value, bool)
+                    )
+
+        self.context['preloaded_objects'] = {
+            model: {str(pk): obj for pk, obj in queryset.in_bulk(pks).items()}
+            for model, (queryset, pks) in pks_by_queryset.items()
+        }
+
+    def split_relations(self, validated_data):
+        """Pop the many-to-many values, which are written after the rows."""
+        model = self.child.Meta.model
+        m2m_names = [field.name for field in model._meta.many_to_many]
+        relations = []
+        for attrs in validated_data:
+            relations.append(
+                {name: attrs.pop(name) for name in m2m_names if name in attrs}
+            )
+        return relations
+
+    def set_relations(self, instances, relations, replace):
+        model = self.child.Meta.model
+        values = {}
+        for instance, item_relations in zip(instances, relations):
+            for name, related in item_relations.items():
+                values.setdefault(name, {})[instance.pk] = related
+        model.bulk_set_relations(
+            values, replace=replace, batch_size=settings.BULK_BATCH_SIZE
+        )
+        for closure in CLOSURE_TABLES:
+            closure.refresh_relations(model, values)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        relations = self.split_relations(validated_data)
+        instances = [model(**attrs) for attrs in validated_data]
+
+        model.bulk_insert(instances, batch_size=settings.BULK_BATCH_SIZE)
+        self.set_relations(instances, relations, replace=False)
+        bulk_changed.send(
+            sender=model, instances=instances, relations=relations, created=True
+        )
+        return instances
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        relations = self.split_relations(validated_data)
+        now = timezone.now()
+        changed_fields = {'last_modified_time'}
+
+        for instance, attrs in zip(instances, validated_data):
+            # The base_id identifies the object and is never changed.
+            attrs.pop('base_id', None)
+            attrs.pop('id_prefix', None)
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                changed_fields.add(model._meta.get_field(attr).name)
+            instance.last_modified_time = now
+
+        model.objects.bulk_update(
+            instances, changed_fields, batch_size=settings.BULK_BATCH_SIZE
+        )
+        self.set_relations(instances, relations, replace=True)
+        bulk_changed.send(
+            sender=model, instances=instances, relations=relations, created=False
+        )
+        return instances
+
+
+def bulk_delete(model, instances):
+    """
+    Delete many objects with a fixed number of queries.
+
+    bulk_changed is sent with deleted=True before the rows go, while the
+    relations of the objects can still be read, and their per-object delete
+    receivers are skipped. The closure table updates are merged into one.
+    """
+    pks = [instance.pk for instance in instances]
+    with transaction.atomic(), defer_closure_removals():
+        bulk_changed.send(
+            sender=model, instances=instances, relations={}, created=False, deleted=True
+        )
+        token = bulk_deleted_pks.set(frozenset(pks))
+        try:
+            model.objects.filter(pk__in=pks).delete()
+        finally:
+            bulk_deleted_pks.reset(token)
@@ -0,0 +1,155 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .exceptions import CursorExpired
+from .filters import parse_timestamp
+from .models import Tombstone
+from .pagination import Row
+from .routers import primary_reads
+from .utils import is_valid_int
+
+FEED_PAGE_SIZE = 100
+MAX_FEED_PAGE_SIZE = 1000
+
+
+def encode_position(timestamp, base_id):
+    token = f'{timestamp.isoformat()}|{base_id}'
+    return urlsafe_b64encode(token.encode()).decode()
+
+
+def decode_position(token):
+    try:
+        timestamp, base_id = urlsafe_b64decode(token.encode()).decode().split('|', 1)
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid cursor')
+    return parse_timestamp(timestamp, 'cursor'), base_id
+
+
+def feed_position(request):
+    """
+    The (time, base_id) position the client has seen everything up to, from
+    ?cursor= or ?modified_since=. None starts from the beginning.
+    """
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        position = decode_position(cursor)
+    elif request.query_params.get('modified_since'):
+        # An empty base_id sorts first, so objects at exactly that time are included.
+        position = (
+            parse_timestamp(request.query_params['modified_since'], 'modified_since'),
+            '',
+        )
+    else:
+        return None
+
+    retention = timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+    if position[0] < timezone.now() - retention:
+        raise CursorExpired()
+    return position
+
+
+def after(position, time_field):
+    """
+    Rows after the position in (time_field, base_id) order, as a row comparison
+    that the (time_field, base_id) indexes scan from the position.
+    """
+    if position is None:
+        return Q()
+    timestamp, base_id = position
+    return GreaterThan(
+        Row(time_field, 'base_id'),
+        Row(Value(timestamp, DateTimeField()), Value(base_id)),
+    )
+
+
+def oldest_write_start(using):
+    """
+    The start of the oldest open transaction that has written to the database,
+    from pg_stat_activity. None if there is none or the database is not
+    PostgreSQL. Sessions of other database roles are only seen with the
+    pg_read_all_stats role.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE backend_xid IS NOT NULL AND datname = current_database() '
+            'AND pid <> pg_backend_pid()'
+        )
+        return cursor.fetchone()[0]
+
+
+def feed_horizon():
+    """
+    The time up to which the feed is complete. Timestamps are taken at save
+    time, so a transaction that commits later can still add rows with an
+    earlier time: rows are held back for CHANGE_FEED_SAFETY_LAG seconds, and
+    on PostgreSQL until the oldest transaction that has written ends.
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG)
+    oldest = oldest_write_start(router.db_for_write(Tombstone))
+    if oldest is not None:
+        horizon = min(horizon, oldest)
+    return horizon
+
+
+@primary_reads()
+def change_feed(request, queryset, serializer):
+    """
+    One page of the objects of `queryset` modified after the client's position
+    and of the objects deleted after it, in time order.
+
+    Rows after feed_horizon() are held back. The returned cursor resumes the
+    feed. Read from the primary: a replica lagging behind the horizon would
+    skip rows.
+    """
+    position = feed_position(request)
+    page_size = min(
+        is_valid_int(request.query_params.get('count', '')) or FEED_PAGE_SIZE,
+        MAX_FEED_PAGE_SIZE,
+    )
+    horizon = feed_horizon()
+
+    modified = queryset.filter(
+        after(position, 'last_modified_time'), last_modified_time__lte=horizon
+    ).order_by('last_modified_time', 'base_id')[: page_size + 1]
+    deleted = Tombstone.objects.filter(
+        after(position, 'deleted_time'),
+        id_prefix=queryset.model.model_prefix,
+        deleted_time__lte=horizon,
+    ).order_by('deleted_time', 'base_id')[: page_size + 1]
+
+    entries = sorted(
+        [(obj.last_modified_time, obj.base_id, obj) for obj in modified]
+        + [(tombstone.deleted_time, tombstone.base_id, None) for tombstone in deleted],
+        key=lambda entry: entry[:2],
+    )
+    more = len(entries) > page_size
+    entries = entries[:page_size]
+    if more:
+        cursor = encode_position(*entries[-1][:2])
+    else:
+        # Everything up to the horizon has been returned.
+        cursor = encode_position(horizon, '')
+
+    return {
+        'cursor': cursor,
+        'more': more,
+        'modified': serializer.to_representation(
+            [obj for _, _, obj in entries if obj is not None]
+        ),
+        'deleted': [
+            {'base_id': base_id, 'deleted_time': timestamp}
+            for timestamp, base_id, obj in entries
+            if obj is None
+        ],
+    }
@@ -0,0 +1,323 @@
+import logging
+import zlib
+from contextlib import contextmanager
+from threading import Lock, Thread, local
+
+from django.db import connections, router, transaction
+
+from .graph import DEPENDENCY_FIELDS
+from .models import DependencyClosure, Keyword, KeywordClosure
+
+logger = logging.getLogger(__name__)
+
+
+class ClosureTable:
+    """
+    Keeps a closure table in step with the graph made by many-to-many fields.
+
+    The table model has `ancestor`, `descendant` and `depth` columns and a unique
+    (ancestor, descendant) constraint. Added edges are merged in with one INSERT
+    per edge. Removed edges invalidate every path that started upstream of
+    them, so the rows of the affected ancestors are deleted and walked again
+    breadth first, one INSERT ... SELECT per level. The first level that reaches
+    a pair is its shortest distance, so ON CONFLICT DO NOTHING also stops cycles.
+
+    Every change takes a transaction-level advisory lock on the table first.
+    Under READ COMMITTED two concurrent relation changes would otherwise each
+    miss the rows the other one writes.
+    """
+
+    # Above this many affected ancestors a full rebuild is cheaper. It is run
+    # after the commit in a background thread instead of in the request.
+    MAX_REFRESH_SIZE = 10000
+
+    def __init__(self, model, fields, reversed_fields=()):
+        self.model = model
+        # (model, many-to-many field name) pairs whose rows point from ancestor to
+        # descendant, see DEPENDENCY_FIELDS, and pairs that point the other way.
+        self.fields = tuple(fields)
+        self.reversed_fields = tuple(reversed_fields)
+        self.deferred = local()
+        self.rebuild_lock = Lock()
+        self.rebuild_running = False
+
+    @property
+    def using(self):
+        return router.db_for_write(self.model)
+
+    def graph_fields(self):
+        """Yields (many-to-many field, whether its rows point to the ancestor)."""
+        for fields, is_reversed in ((self.fields, False), (self.reversed_fields, True)):
+            for model, field_name in fields:
+                yield model._meta.get_field(field_name), is_reversed
+
+    def node_models(self):
+        """Models whose objects are nodes of the graph."""
+        models = []
+        for field, _ in self.graph_fields():
+            for model in (field.model, field.related_model):
+                if model not in models:
+                    models.append(model)
+        return models
+
+    def through_models(self):
+        return [field.remote_field.through for field, _ in self.graph_fields()]
+
+    def is_symmetrical(self, field):
+        return field.remote_field.symmetrical and field.related_model is field.model
+
+    def edges_sql(self, quote_name):
+        """SELECT source, target over the through tables of the graph fields."""
+        selects = []
+        for field, is_reversed in self.graph_fields():
+            through = field.remote_field.through._meta
+            source = through.get_field(field.m2m_field_name()).column
+            target = through.get_field(field.m2m_reverse_field_name()).column
+            if is_reversed:
+                source, target = target, source
+            selects.append(
+                f'SELECT {quote_name(source)} AS source, {quote_name(target)} AS target '
+                f'FROM {quote_name(through.db_table)}'
+            )
+        return ' UNION ALL '.join(selects)
+
+    def handle_m2m_changed(self, sender, instance, action, reverse, pk_set):
+        """Apply an m2m_changed signal of one of the through models."""
+        if action == 'post_add':
+            field, is_reversed = next(
+                (field, is_reversed)
+                for field, is_reversed in self.graph_fields()
+                if field.remote_field.through is sender
+            )
+            edges = [
+                (pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set
+            ]
+            if is_reversed:
+                edges = [(target, source) for source, target in edges]
+            if self.is_symmetrical(field):
+                edges += [(target, source) for source, target in edges]
+            self.add_edges(edges)
+        elif action in ('post_remove', 'post_clear'):
+            # pk_set is None for clear(), the instance's ancestors cover both sides.
+            self.refresh({instance.pk, *(pk_set or ())})
+
+    @contextmanager
+    def locked(self):
+        """Transaction with the advisory lock of this closure table held."""
+        with transaction.atomic(using=self.using):
+            connection = connections[self.using]
+            if connection.vendor == 'postgresql':
+                key = zlib.crc32(self.model._meta.db_table.encode())
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+            yield
+
+    def execute(self, sql, params=()):
+        connection = connections[self.using]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        edges = self.edges_sql(connection.ops.quote_name)
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(table=table, edges=edges), params)
+            return cursor.rowcount
+
+    def ancestors(self, base_ids):
+        """The given objects and every object that reaches one of them."""
+        base_ids = set(base_ids)
+        return base_ids | set(
+            self.model.objects.using(self.using)
+            .filter(descendant__in=base_ids)
+            .values_list('ancestor', flat=True)
+        )
+
+    def add_edges(self, edges):
+        """Merge (source, target) edges into the closure."""
+        with self.locked():
+            for source, target in edges:
+                self.add_edge(source, target)
+
+    def add_edge(self, source, target):
+        # Every ancestor of source (and source) now reaches every descendant
+        # of target (and target), keeping the shorter of two depths.
+        self.execute(
+            '''
+            INSERT INTO {table} (ancestor, descendant, depth)
+            SELECT a.node, d.node, MIN(a.depth + 1 + d.depth)
+            FROM (
+                SELECT %s AS node, 0 AS depth
+                UNION ALL
+                SELECT ancestor, depth FROM {table} WHERE descendant = %s
+            ) a
+            CROSS JOIN (
+                SELECT %s AS node, 0 AS depth
+                UNION ALL
+                SELECT descendant, depth FROM {table} WHERE ancestor = %s
+            ) d
+            WHERE a.node <> d.node
+            GROUP BY a.node, d.node
+            ON CONFLICT (ancestor, descendant) DO UPDATE SET depth = CASE
+                WHEN excluded.depth < {table}.depth THEN excluded.depth
+                ELSE {table}.depth
+            END
+            ''',
+            [source, source, target, target],
+        )
+
+    def refresh_relations(self, model, relations):
+        """
+        Refresh after many-to-many values were written without m2m_changed, e.g.
+        by BaseModel.bulk_set_relations. Takes the same `relations` mapping.
+        """
+        base_ids = set()
+        for field, is_reversed in self.graph_fields():
+            if field.model is not model or field.name not in relations:
+                continue
+            values = relations[field.name]
+            related_ids = {
+                getattr(obj, 'pk', obj)
+                for related in values.values()
+                for obj in related
+            }
+            # Rows start at the objects, at the related objects when reversed, and
+            # at both for symmetrical relations.
+            if not is_reversed or self.is_symmetrical(field):
+                base_ids.update(values)
+            if is_reversed or self.is_symmetrical(field):
+                base_ids.update(related_ids)
+        if base_ids:
+            self.refresh(base_ids)
+
+    def refresh(self, base_ids):
+        """Recompute the rows of everything upstream of the given objects."""
+        with self.locked():
+            ancestors = self.ancestors(base_ids)
+            if len(ancestors) > self.MAX_REFRESH_SIZE:
+                logger.warning(
+                    '%s: %d ancestors to refresh, rebuilding after commit',
+                    self.model.__name__,
+                    len(ancestors),
+                )
+                transaction.on_commit(self.start_rebuild, using=self.using)
+            elif ancestors:
+                self.walk(sorted(ancestors))
+
+    def start_rebuild(self):
+        """Rebuild in a background thread, unless a rebuild is already running."""
+        with self.rebuild_lock:
+            if self.rebuild_running:
+                return
+            self.rebuild_running = True
+        Thread(
+            target=self.background_rebuild,
+            name=f'rebuild-{self.model._meta.db_table}',
+            daemon=True,
+        ).start()
+
+    def background_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('%s: rebuild failed', self.model.__name__)
+        finally:
+            with self.rebuild_lock:
+                self.rebuild_running = False
+            connections.close_all()
+
+    @contextmanager
+    def defer_removals(self):
+        """Collect the remove_nodes calls of a block and run them once at its end."""
+        self.deferred.base_ids = set()
+        try:
+            yield
+            base_ids = self.deferred.base_ids
+        finally:
+            self.deferred.base_ids = None
+        if base_ids:
+            self.remove_nodes(base_ids)
+
+    def remove_nodes(self, base_ids):
+        """Drop deleted objects from the closure."""
+        pending = getattr(self.deferred, 'base_ids', None)
+        if pending is not None:
+            pending.update(base_ids)
+            return
+
+        with self.locked():
+            ancestors = self.ancestors(base_ids) - set(base_ids)
+            rows = self.model.objects.using(self.using)
+            rows.filter(descendant__in=base_ids).delete()
+            rows.filter(ancestor__in=base_ids).delete()
+            if ancestors:
+                self.refresh(ancestors)
+
+    def rebuild(self):
+        """Recompute the whole table, returns the number of rows."""
+        with self.locked():
+            return self.walk(None)
+
+    def walk(self, ancestors):
+        """
+        Delete and recompute the rows of the given ancestors (all if None).
+
+        Placeholders are used for the ancestor list, MAX_REFRESH_SIZE keeps them
+        under the database parameter limit.
+        """
+        rows = self.model.objects.using(self.using)
+        params = []
+        if ancestors is not None:
+            rows = rows.filter(ancestor__in=ancestors)
+            params = list(ancestors)
+        rows.delete()
+
+        def restrict(column):
+            if ancestors is None:
+                return ''
+            return f"AND {column} IN ({', '.join(['%s'] * len(ancestors))})"
+
+        total = self.execute(
+            f'''
+            INSERT INTO {{table}} (ancestor, descendant, depth)
+            SELECT DISTINCT edges.source, edges.target, 1
+            FROM ({{edges}}) edges
+            WHERE edges.source <> edges.target {restrict('edges.source')}
+            ON CONFLICT (ancestor, descendant) DO NOTHING
+            ''',
+            params,
+        )
+        depth = 1
+        while True:
+            depth += 1
+            inserted = self.execute(
+                f'''
+                INSERT INTO {{table}} (ancestor, descendant, depth)
+                SELECT DISTINCT closure.ancestor, edges.target, %s
+                FROM {{table}} closure
+                JOIN ({{edges}}) edges ON edges.source = closure.descendant
+                WHERE closure.depth = %s AND edges.target <> closure.ancestor
+                {restrict('closure.ancestor')}
+                ON CONFLICT (ancestor, descendant) DO NOTHING
+                ''',
+                [depth, depth - 1] + params,
+            )
+            if not inserted:
+                return total
+            total += inserted
+
+
+dependency_closure = ClosureTable(DependencyClosure, DEPENDENCY_FIELDS)
+
+# Ancestors are the broader concepts. `broader` rows point from a keyword to its
+# broader concept, `narrower` rows from a keyword to its narrower concept.
+keyword_closure = ClosureTable(
+    KeywordClosure,
+    fields=((Keyword, 'narrower'),),
+    reversed_fields=((Keyword, 'broader'),),
+)
+
+CLOSURE_TABLES = (dependency_closure, keyword_closure)
+
+
+@contextmanager
+def defer_closure_removals():
+    """ClosureTable.defer_removals for every closure table."""
+    with dependency_closure.defer_removals(), keyword_closure.defer_removals():
+        yield
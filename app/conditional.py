@@ -0,0 +1,129 @@
+from calendar import timegm
+from hashlib import md5
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .representations import representation_versions, version_time
+
+
+def request_variant(request):
+    """The parts of a request besides the data that change the representation."""
+    return (
+        request.path,
+        sorted(request.query_params.lists()),
+        request.accepted_renderer.format,
+    )
+
+
+def make_validators(request, last_modified, *state):
+    """Return (ETag, Last-Modified timestamp) for the given data state."""
+    digest = md5(repr((request_variant(request),) + state).encode()).hexdigest()
+    return quote_etag(digest), last_modified
+
+
+def timestamp(value):
+    return timegm(value.utctimetuple()) if value else None
+
+
+def page_validators(request, envelope, objects, versions):
+    """
+    Validators of a list page, from the objects on it and their representation
+    versions, which change with the nested objects. `envelope` is the rest of the
+    paginated response, e.g. the count and the links.
+
+    A list has no Last-Modified: deleted rows and rows that left the filter
+    would not move it.
+    """
+    state = [(obj.pk, obj.last_modified_time, versions[obj.pk]) for obj in objects]
+    return make_validators(request, None, envelope, state)
+
+
+async def aobject_validators(request, queryset, pk):
+    """
+    Validators of one object, None if it does not exist, read by the async ORM.
+    They include the representation version, which changes with the nested
+    objects, and Last-Modified is the later of last_modified_time and the
+    creation of that version.
+    """
+    rows = [
+        row
+        async for row in queryset.filter(pk=pk).values_list(
+            'last_modified_time', flat=True
+        )
+    ]
+    if not rows:
+        return None
+    version = (await sync_to_async(representation_versions)({pk}))[pk]
+    last_modified = max(
+        filter(None, (timestamp(rows[0]), version_time(version))), default=None
+    )
+    return make_validators(request, last_modified, pk, rows[0], version)
+
+
+def not_modified_response(request, validators):
+    """The 304 response for a conditional GET whose validators match, or None."""
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def add_validator_headers(response, validators):
+    etag, last_modified = validators
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def touch(queryset):
+    """Bump last_modified_time without save(), e.g. after relation changes."""
+    return queryset.update(last_modified_time=timezone.now())
+
+
+def touch_relations(model, pks):
+    """
+    Bump the objects related to the given objects through many-to-many relations
+    and reverse foreign keys, one UPDATE per relation. Their rows are deleted or
+    nulled without signals when the objects are deleted.
+    """
+    for field in model._meta.get_fields():
+        if not (field.many_to_many or field.one_to_many):
+            continue
+        if not hasattr(field.related_model, 'last_modified_time'):
+            continue
+        if not field.concrete and (field.is_hidden() or not field.get_accessor_name()):
+            continue
+        touch(
+            field.related_model._default_manager.filter(
+                pk__in=model._default_manager.filter(
+                    pk__in=pks, **{f'{field.name}__isnull': False}
+                ).values(field.name)
+            )
+        )
+
+
+def touch_m2m_change(sender, instance, action, reverse, model, pk_set):
+    """Bump both sides of an m2m_changed signal."""
+    if action in ('post_add', 'post_remove'):
+        touch(type(instance)._default_manager.filter(pk=instance.pk))
+        touch(model._default_manager.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        # pk_set is not known for clear(), the related side is read from the rows.
+        owner = model if reverse else type(instance)
+        field = next(
+            field
+            for field in owner._meta.many_to_many
+            if field.remote_field.through is sender
+        )
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        if reverse:
+            source, target = target, source
+        touch(type(instance)._default_manager.filter(pk=instance.pk))
+        touch(
+            model._default_manager.filter(
+                pk__in=sender.objects.filter(**{source: instance.pk}).values(target)
+            )
+        )
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 
+from .bulk import BulkListSerializer, BulkPrimaryKeyRelatedField
+from .prefetch import build_prefetch_plan, limited_prefetch_attr
+from .representations import CachedListSerializer
 from .utils import query_param_validator
 from .nested import (
     NestedCustomershipSerializer,
@@ -34,6 +37,38 @@ class BaseSerializer(serializers.ModelSerializer):
     base_id = serializers.CharField(required=False)
     id_prefix = serializers.CharField(required=False)
 
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
+    def validate_base_id(self, value):
+        # The base_id identifies the object and is never changed.
+        if isinstance(self.instance, BaseModel) and value != self.instance.base_id:
+            raise serializers.ValidationError(
+                'The base_id of an object cannot be changed.'
+            )
+        return value
+
+    def validate_id_prefix(self, value):
+        if isinstance(self.instance, BaseModel) and value != self.instance.id_prefix:
+            raise serializers.ValidationError(
+                'The id_prefix of an object cannot be changed.'
+            )
+        return value
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Sparse fieldsets for reads: ?fields= picks the fields and ?expand= the
+        # nested relations that get rendered.
+        request = self.context.get('request')
+        if request is not None and request.method in ['GET']:
+            selected = build_prefetch_plan(type(self)).select(
+                fields=query_param_validator(request=request, param='fields'),
+                expand=query_param_validator(request=request, param='expand'),
+            )
+            if selected is not None:
+                for field_name in set(self.fields) - selected:
+                    self.fields.pop(field_name)
+
     def process_nested_objects(self, obj_attr):
         # Validate the nested_max_count parameter.
         nested_max_count = query_param_validator(
@@ -41,6 +76,14 @@ class BaseSerializer(serializers.ModelSerializer):
         )
 
         if nested_max_count is not None:
+            # Use the per-parent limited prefetch made by the viewset if there is one.
+            limited = getattr(
+                obj_attr.instance,
+                limited_prefetch_attr(obj_attr.prefetch_cache_name),
+                None,
+            )
+            if limited is not None:
+                return limited
             return obj_attr.all()[:nested_max_count]
         return obj_attr.all()
 
@@ -53,12 +96,14 @@ class CustomershipSerializer(BaseSerializer):
     class Meta:
         model = Customership
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ProviderSerializer(BaseSerializer):
     class Meta:
         model = Provider
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ProviderReadSerializer(BaseSerializer):
@@ -85,12 +130,14 @@ class ProviderReadSerializer(BaseSerializer):
     class Meta:
         model = Provider
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class LicenseSerializer(BaseSerializer):
     class Meta:
         model = License
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class LicenseReadSerializer(BaseSerializer):
@@ -100,12 +147,14 @@ class LicenseReadSerializer(BaseSerializer):
     class Meta:
         model = License
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class ContractSerializer(BaseSerializer):
     class Meta:
         model = Contract
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ContractReadSerializer(BaseSerializer):
@@ -118,6 +167,7 @@ class ContractReadSerializer(BaseSerializer):
     class Meta:
         model = Contract
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
     def get_related_applications(self, obj):
         return NestedContractSerializer(
@@ -129,6 +179,7 @@ class IntegrationSerializer(BaseSerializer):
     class Meta:
         model = Integration
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class IntegrationReadSerializer(BaseSerializer):
@@ -138,12 +189,14 @@ class IntegrationReadSerializer(BaseSerializer):
     class Meta:
         model = Integration
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class ApplicationSerializer(BaseSerializer):
     class Meta:
         model = Application
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ApplicationReadSerializer(BaseSerializer):
@@ -187,12 +240,14 @@ class ApplicationReadSerializer(BaseSerializer):
     class Meta:
         model = Application
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class ServiceSerializer(BaseSerializer):
     class Meta:
         model = Service
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ServiceReadSerializer(BaseSerializer):
@@ -223,12 +278,14 @@ class ServiceReadSerializer(BaseSerializer):
     class Meta:
         model = Service
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class ServerSerializer(BaseSerializer):
     class Meta:
         model = Server
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class ServerReadSerializer(BaseSerializer):
@@ -249,12 +306,14 @@ class ServerReadSerializer(BaseSerializer):
     class Meta:
         model = Server
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class DirectorySerializer(BaseSerializer):
     class Meta:
         model = Directory
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class DirectoryReadSerializer(BaseSerializer):
@@ -281,12 +340,14 @@ class DirectoryReadSerializer(BaseSerializer):
     class Meta:
         model = Directory
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class KeywordSerializer(BaseSerializer):
     class Meta:
         model = Keyword
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class KeywordReadSerializer(BaseSerializer):
@@ -316,12 +377,14 @@ class KeywordReadSerializer(BaseSerializer):
     class Meta:
         model = Keyword
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
 
 
 class KeywordSetSerializer(BaseSerializer):
     class Meta:
         model = KeywordSet
         exclude = ('base_token',)
+        list_serializer_class = BulkListSerializer
 
 
 class KeywordSetReadSerializer(BaseSerializer):
@@ -336,3 +399,4 @@ class KeywordSetReadSerializer(BaseSerializer):
     class Meta:
         model = KeywordSet
         exclude = ('base_token',)
+        list_serializer_class = CachedListSerializer
@@ -0,0 +1,30 @@
+import json
+
+from django.conf import settings
+from django.db import connections, router
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+def event(action, model, base_id):
+    """An event as sent through NOTIFY. `type` is the endpoint name of the model."""
+    return {'action': action, 'type': model._meta.model_name, 'base_id': base_id}
+
+
+def publish(model, events):
+    """
+    Send the events to the EVENTS_CHANNEL with one pg_notify() call.
+
+    NOTIFY is transactional, listeners only see the events of committed
+    transactions. Nothing is sent on databases other than PostgreSQL.
+    """
+    connection = connections[router.db_for_write(model)]
+    if not events or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+            [settings.EVENTS_CHANNEL, [json.dumps(event) for event in events]],
+        )
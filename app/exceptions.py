@@ -6,7 +6,14 @@ class ExceptionMessage(APIException):
 
 
 class TokenGenerationException(APIException):
-    """Throw this error when token generation fails after 5 tries."""
+    """Throw this error when inserting fails on duplicate base_ids after 5 tries."""
 
     status_code = 404
     default_detail = 'Token generation failed after multiple retries. Please contact an administrator!'
+
+
+class CursorExpired(APIException):
+    """The change feed position is older than the kept tombstones."""
+
+    status_code = 410
+    default_detail = 'The position is older than the kept deletions, start a full sync.'
@@ -0,0 +1,117 @@
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .renderers import FastJSONRenderer
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+EXPORT_FORMATS = (NDJSON, CSV)
+
+# Cells starting with these are formulas in spreadsheet applications.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    """File-like object for csv.writer that returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def export_rows(serializer, queryset, chunk_size):
+    """
+    Yield the representations of the queryset's objects, a list per chunk.
+
+    Rows are read through a server-side cursor. The list serializer prefetches
+    the relations of each chunk if it can, e.g. CachedListSerializer, and the
+    objects are rendered with its child, so that an export does not push the
+    cached representations out of the cache.
+    """
+    prefetch = getattr(serializer, 'prefetch', None)
+    # Bind the database now, the rows are read after the view has returned.
+    queryset = queryset.using(queryset.db)
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        if prefetch is not None:
+            prefetch(chunk)
+        yield [serializer.child.to_representation(obj) for obj in chunk]
+
+
+def ndjson_chunks(chunks):
+    renderer = FastJSONRenderer()
+    for rows in chunks:
+        yield b''.join(renderer.render(row) + b'\n' for row in rows)
+
+
+def csv_cell(renderer, value):
+    """
+    Nested relations and other structured values are JSON encoded. Text that a
+    spreadsheet would run as a formula is prefixed with a quote.
+    """
+    if isinstance(value, (list, dict)):
+        return renderer.render(value).decode()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def csv_chunks(fields, chunks):
+    renderer = FastJSONRenderer()
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for rows in chunks:
+        yield ''.join(
+            writer.writerow([csv_cell(renderer, row.get(field)) for field in fields])
+            for row in rows
+        )
+
+
+async def aiterate(iterator):
+    """
+    Iterate a sync iterator from the event loop, each step in sync_to_async.
+
+    The steps run in the thread of the request's sync code, which holds the
+    connection of the server-side cursor, and the loop sends each chunk while
+    the next one is read.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(iterator, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+def export_response(request, serializer, queryset, output, chunk_size, filename):
+    """
+    Stream the queryset as NDJSON or CSV. `request` is the Django request and
+    `serializer` a list serializer.
+
+    Each chunk of objects is sent as one part. Under ASGI the content is an
+    async iterator, Django would read a sync one to the end before sending it.
+    """
+    chunks = export_rows(serializer, queryset, chunk_size)
+    if output == CSV:
+        content = csv_chunks(list(serializer.child.fields), chunks)
+    else:
+        content = ndjson_chunks(chunks)
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -1,6 +1,23 @@
 from rest_framework.filters import BaseFilterBackend
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import CharField, TextField
+
+# Query parameters that are consumed elsewhere and never treated as field filters.
+RESERVED_QUERY_PARAMS = (
+    'page',
+    'count',
+    'cursor',
+    'nested_max_count',
+    'fields',
+    'expand',
+    'direction',
+    'depth',
+    'output',
+    'modified_since',
+)
 
 
 class FieldsFilter(BaseFilterBackend):
@@ -13,23 +30,69 @@ class FieldsFilter(BaseFilterBackend):
     3) {endpoint}/?count=10&ownership=test&classification=test
 
     Order of these parameters does not matter.
+
+    Matching uses the pg_trgm `%` operator (`trigram_similar` lookup) so the
+    trigram GIN indexes can pick the candidate rows. The similarity threshold is
+    set once per database session, see `TRIGRAM_SIMILARITY_THRESHOLD`. Only the
+    candidates are scored and ordered by their combined similarity. Only text
+    fields can be matched this way, other fields are rejected with 400.
     """
 
     def filter_queryset(self, request, queryset, view):
+        similarity = None
+
         for field_name, value in request.GET.items():
             # Taking into consideration the default Django REST filter parameters:
-            if field_name not in ('page', 'count', 'nested_max_count'):
+            if field_name not in RESERVED_QUERY_PARAMS:
                 try:
-                    queryset.model._meta.get_field(field_name)
+                    field = queryset.model._meta.get_field(field_name)
                 except Exception as e:
                     raise NotFound(
                         f"field filter error. {value} is not a valid value for {field_name} ({str(e)})"
                     )
+                if not isinstance(field, (CharField, TextField)):
+                    raise ValidationError(
+                        f'field filter error. {field_name} is not a text field'
+                    )
 
-                queryset = (
-                    queryset.annotate(similarity=TrigramSimilarity(field_name, value))
-                    .filter(similarity__gte=0.1)
-                    .order_by('-similarity')
+                queryset = queryset.filter(**{f'{field_name}__trigram_similar': value})
+                field_similarity = TrigramSimilarity(field_name, value)
+                similarity = (
+                    field_similarity
+                    if similarity is None
+                    else similarity + field_similarity
                 )
 
+        if similarity is not None:
+            queryset = queryset.annotate(similarity=similarity).order_by('-similarity')
+
         return queryset
+
+
+def parse_timestamp(value, param):
+    """Parse an ISO 8601 query parameter, naive values are in the default timezone."""
+    try:
+        timestamp = parse_datetime(value)
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ValidationError(f'{param} must be an ISO 8601 date and time, not {value}')
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+class ModifiedSinceFilter(BaseFilterBackend):
+    """
+    Objects modified at or after a point in time, on the last_modified_time index.
+
+    Example: {endpoint}/?modified_since=2023-05-01T12:00:00Z
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get('modified_since')
+        if not value:
+            return queryset
+        return queryset.filter(
+            last_modified_time__gte=parse_timestamp(value, 'modified_since')
+        )
@@ -0,0 +1,127 @@
+from functools import lru_cache
+
+from django.db import connections, router
+
+from .models import Application, DependencyClosure, Service
+
+# Relations that make up the dependency graph, as (model, many-to-many field).
+# An edge points from the dependent object to the object it depends on.
+#
+# application_dependency and related_services are symmetrical self relations,
+# Django stores them in both directions and they carry no direction. Between
+# two applications (or two services) linked this way each is upstream and
+# downstream of the other, and so are the objects reached through them.
+DEPENDENCY_FIELDS = (
+    (Application, 'application_dependency'),
+    (Application, 'service_dependency'),
+    (Service, 'related_services'),
+    (Service, 'required_installations'),
+)
+
+UPSTREAM = 'upstream'
+DOWNSTREAM = 'downstream'
+BOTH = 'both'
+DIRECTIONS = (UPSTREAM, DOWNSTREAM, BOTH)
+
+DEFAULT_DEPTH = 5
+MAX_DEPTH = 20
+
+
+def node_models():
+    """Models whose objects can be nodes of the dependency graph."""
+    models = []
+    for model, field_name in DEPENDENCY_FIELDS:
+        for node_model in (model, model._meta.get_field(field_name).related_model):
+            if node_model not in models:
+                models.append(node_model)
+    return models
+
+
+@lru_cache(maxsize=None)
+def dependency_graph_sql(using):
+    """
+    Build the query that reads the dependencies of one object.
+
+    Both directions are indexed lookups on the DependencyClosure table, the
+    names are joined in the same statement.
+    """
+    quote_name = connections[using].ops.quote_name
+    table = quote_name(DependencyClosure._meta.db_table)
+    joins = []
+    columns = {'id_prefix': [], 'name': []}
+    for i, model in enumerate(node_models()):
+        joins.append(
+            f'LEFT JOIN {quote_name(model._meta.db_table)} n{i} '
+            f'ON n{i}.{quote_name(model._meta.pk.column)} = closure.node'
+        )
+        for column in columns:
+            columns[column].append(f'n{i}.{quote_name(column)}')
+
+    return f'''
+        SELECT
+            closure.direction,
+            closure.node,
+            closure.depth,
+            COALESCE({', '.join(columns['id_prefix'])}),
+            COALESCE({', '.join(columns['name'])})
+        FROM (
+            SELECT 'self' AS direction, %(base_id)s AS node, 0 AS depth
+            UNION ALL
+            SELECT '{UPSTREAM}', descendant, depth FROM {table}
+            WHERE ancestor = %(base_id)s AND depth <= %(depth)s AND %(upstream)s
+            UNION ALL
+            SELECT '{DOWNSTREAM}', ancestor, depth FROM {table}
+            WHERE descendant = %(base_id)s AND depth <= %(depth)s AND %(downstream)s
+        ) closure
+        {' '.join(joins)}
+        ORDER BY closure.depth, 5
+    '''
+
+
+def dependency_graph(base_id, direction=BOTH, depth=DEFAULT_DEPTH):
+    """
+    Return the transitive dependencies of an object up to `depth` hops.
+
+    Upstream objects are the ones the object depends on, downstream objects the
+    ones that depend on it, i.e. what breaks when it goes down. Symmetrical
+    relations count in both directions, see DEPENDENCY_FIELDS. Depth 0 returns
+    only the object. Returns None if the object is not part of the graph models.
+    """
+    using = router.db_for_read(Application)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            dependency_graph_sql(using),
+            {
+                'base_id': base_id,
+                'depth': depth,
+                'upstream': direction in (UPSTREAM, BOTH),
+                'downstream': direction in (DOWNSTREAM, BOTH),
+            },
+        )
+        rows = cursor.fetchall()
+
+    graph = {}
+    for row_direction, node, node_depth, id_prefix, name in rows:
+        if row_direction == 'self':
+            if id_prefix is None:
+                return None
+            graph = {
+                'base_id': node,
+                'id_prefix': id_prefix,
+                'name': name,
+                'depth': depth,
+            }
+            if direction in (UPSTREAM, BOTH):
+                graph[UPSTREAM] = []
+            if direction in (DOWNSTREAM, BOTH):
+                graph[DOWNSTREAM] = []
+        else:
+            graph[row_direction].append(
+                {
+                    'base_id': node,
+                    'id_prefix': id_prefix,
+                    'name': name,
+                    'depth': node_depth,
+                }
+            )
+    return graph
@@ -0,0 +1,267 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Application, Customership, Server, Service
+from .routers import primary_reads
+
+# Relations the report is made of, as (model, many-to-many field name).
+SERVER_APPLICATION_FIELDS = (
+    (Server, 'applications'),
+    (Application, 'installed_server'),
+)
+APPLICATION_SERVICE_FIELDS = ((Service, 'required_installations'),)
+CUSTOMERSHIP_FIELDS = (
+    (Server, 'customership'),
+    (Application, 'customership'),
+    (Service, 'customership'),
+)
+IMPACT_MODELS = (Server, Application, Service, Customership)
+
+# Reports are cached under the generation, replaced to drop all of them, and a
+# version token per server, deleted to drop the reports of that server. The
+# cache has to be shared by all processes, see CACHE_URL: with the per-process
+# locmem cache an invalidation only reaches the process that made the change.
+CACHE_PREFIX = 'server-impact'
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+
+
+def impact_through_models():
+    """Through models whose changes invalidate the cached reports."""
+    return [
+        model._meta.get_field(field_name).remote_field.through
+        for model, field_name in (
+            SERVER_APPLICATION_FIELDS + APPLICATION_SERVICE_FIELDS + CUSTOMERSHIP_FIELDS
+        )
+    ]
+
+
+def impact_field_names(model):
+    """Names of the many-to-many fields of the model the reports are made of."""
+    return {
+        field_name
+        for field_model, field_name in (
+            SERVER_APPLICATION_FIELDS + APPLICATION_SERVICE_FIELDS + CUSTOMERSHIP_FIELDS
+        )
+        if field_model is model
+    }
+
+
+def through_pairs(fields, related_model, base_ids):
+    """
+    One query for the (object, related object) pairs of the given fields, for
+    the objects in `base_ids`. The relation may be declared on either side.
+    """
+    querysets = []
+    for model, field_name in fields:
+        field = model._meta.get_field(field_name)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        if model is related_model:
+            source, target = target, source
+        querysets.append(
+            field.remote_field.through.objects.filter(
+                **{f'{source}__in': base_ids}
+            ).values_list(source, target)
+        )
+    return querysets[0].union(*querysets[1:])
+
+
+def group_pairs(pairs):
+    groups = {}
+    for base_id, related_id in pairs:
+        groups.setdefault(base_id, set()).add(related_id)
+    return groups
+
+
+def compute_server_impact(server_ids):
+    """
+    Build the reports of the given servers with four queries in total:
+    installed applications, their dependent services, the customerships of all of
+    them, and the names.
+    """
+    apps_by_server = group_pairs(
+        through_pairs(SERVER_APPLICATION_FIELDS, Application, server_ids)
+    )
+    app_ids = set().union(*apps_by_server.values())
+
+    services_by_app = group_pairs(
+        through_pairs(APPLICATION_SERVICE_FIELDS, Service, app_ids)
+    )
+    service_ids = set().union(*services_by_app.values())
+
+    # base_ids carry the model prefix, so ids of different models never clash.
+    customerships_by_owner = group_pairs(
+        through_pairs(
+            CUSTOMERSHIP_FIELDS,
+            Customership,
+            set(server_ids) | app_ids | service_ids,
+        )
+    )
+    customership_ids = set().union(*customerships_by_owner.values())
+
+    names = dict(
+        Server.objects.filter(pk__in=server_ids)
+        .values_list('base_id', 'name')
+        .union(
+            Application.objects.filter(pk__in=app_ids).values_list('base_id', 'name'),
+            Service.objects.filter(pk__in=service_ids).values_list('base_id', 'name'),
+            Customership.objects.filter(pk__in=customership_ids).values_list(
+                'base_id', 'name'
+            ),
+        )
+    )
+
+    def summaries(base_ids):
+        return sorted(
+            (
+                {'base_id': base_id, 'name': names[base_id]}
+                for base_id in base_ids
+                if base_id in names
+            ),
+            key=lambda summary: (summary['name'], summary['base_id']),
+        )
+
+    reports = {}
+    for server_id in server_ids:
+        if server_id not in names:
+            continue
+        server_apps = apps_by_server.get(server_id, set())
+        server_services = set().union(
+            *(services_by_app.get(app_id, set()) for app_id in server_apps)
+        )
+        server_customerships = set().union(
+            *(
+                customerships_by_owner.get(owner_id, set())
+                for owner_id in {server_id} | server_apps | server_services
+            )
+        )
+        reports[server_id] = {
+            'base_id': server_id,
+            'name': names[server_id],
+            'applications': summaries(server_apps),
+            'services': summaries(server_services),
+            'customerships': summaries(server_customerships),
+        }
+    return reports
+
+
+def impact_generation():
+    """Token that is part of every cache key, replaced to invalidate all reports."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def version_key(server_id):
+    return f'{CACHE_PREFIX}:version:{server_id}'
+
+
+def server_versions(server_ids):
+    """Return {server base_id: version token}, see representation_versions."""
+    keys = {version_key(server_id): server_id for server_id in server_ids}
+    versions = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def affected_servers(model, base_ids):
+    """The servers whose reports show any of the given objects."""
+    base_ids = set(base_ids)
+    if not base_ids:
+        return set()
+    if model is Server:
+        return base_ids
+    if model is Application:
+        return {
+            server_id
+            for _, server_id in through_pairs(
+                SERVER_APPLICATION_FIELDS, Server, base_ids
+            )
+        }
+    if model is Service:
+        app_ids = {
+            app_id
+            for _, app_id in through_pairs(
+                APPLICATION_SERVICE_FIELDS, Application, base_ids
+            )
+        }
+        return affected_servers(Application, app_ids)
+    if model is Customership:
+        querysets = []
+        for owner_model, field_name in CUSTOMERSHIP_FIELDS:
+            field = owner_model._meta.get_field(field_name)
+            querysets.append(
+                field.remote_field.through.objects.filter(
+                    **{f'{field.m2m_reverse_field_name()}_id__in': base_ids}
+                ).values_list(f'{field.m2m_field_name()}_id', flat=True)
+            )
+        owner_ids = set(querysets[0].union(*querysets[1:]))
+        # base_ids carry the model prefix of their object.
+        owners = {
+            owner_model: {
+                owner_id
+                for owner_id in owner_ids
+                if owner_id.startswith(f'{owner_model.model_prefix}-')
+            }
+            for owner_model, _ in CUSTOMERSHIP_FIELDS
+        }
+        return (
+            owners[Server]
+            | affected_servers(Application, owners[Application])
+            | affected_servers(Service, owners[Service])
+        )
+    return set()
+
+
+def invalidate_server_impact(server_ids=None):
+    """
+    Drop the cached reports of the given servers, of all servers if None.
+
+    Runs after the commit: a report computed from the data before the commit
+    would otherwise be cached again under the new version.
+    """
+    if server_ids is None:
+        transaction.on_commit(
+            lambda: cache.set(GENERATION_KEY, uuid4().hex, timeout=None)
+        )
+    elif server_ids:
+        keys = [version_key(server_id) for server_id in server_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def server_impact(server_ids):
+    """
+    Return {server base_id: report} for the existing servers among `server_ids`.
+
+    Reports come from the cache where possible, only the misses are computed.
+    """
+    generation = impact_generation()
+    versions = server_versions(server_ids)
+    keys = {
+        f'{CACHE_PREFIX}:{generation}:{server_id}:{versions[server_id]}': server_id
+        for server_id in server_ids
+    }
+    reports = {keys[key]: report for key, report in cache.get_many(keys).items()}
+
+    missing = [server_id for server_id in server_ids if server_id not in reports]
+    if missing:
+        # A lagging replica would put old reports under the current versions.
+        with primary_reads():
+            computed = compute_server_impact(missing)
+        cache.set_many(
+            {
+                f'{CACHE_PREFIX}:{generation}:{server_id}:{versions[server_id]}': report
+                for server_id, report in computed.items()
+            },
+            timeout=settings.IMPACT_CACHE_TIMEOUT,
+        )
+        reports.update(computed)
+    return reports
@@ -1,10 +1,19 @@
 import os
 import json
+import re
+import time
 
+from collections import defaultdict
 from typing import Any
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from app.closure import dependency_closure
+from app.exceptions import TokenGenerationException
+from app.impact import invalidate_server_impact
 from app.models import (
     Application,
+    BaseModel,
     Contract,
     Customership,
     Directory,
@@ -14,15 +23,16 @@ from app.models import (
     Server,
     Service,
 )
+from app.utils import assign_base_id, is_base_id_conflict
 
 
 class Importer:
     help = 'This is an import class that imports default json data.'
+    # Directory of the {json_keyword}.json files.
+    data_dir = os.path.join(os.path.dirname(__file__), 'import_data')
 
     def __init__(self, json_keyword, class_name):
-        self.script_dir = os.path.dirname(__file__)
-        self.rel_path = f"import_data/{json_keyword}.json"
-        self.abs_file_path = os.path.join(self.script_dir, self.rel_path)
+        self.abs_file_path = os.path.join(self.data_dir, f"{json_keyword}.json")
         self.json_keyword = json_keyword
         self.class_name = class_name
         self.obj_data = {}
@@ -30,11 +40,18 @@ class Importer:
     def read_data(self) -> Any:
         """Fetches the json file and returns it in readable format."""
         with open(self.abs_file_path, "r") as json_file:
-            data = json.load(json_file)
+            try:
+                data = json.load(json_file)
+            except json.JSONDecodeError as e:
+                # e.pos counts characters, the byte offset is what editors show.
+                offset = len(e.doc[: e.pos].encode(json_file.encoding or 'utf-8'))
+                raise CommandError(
+                    f"Invalid JSON in {self.abs_file_path} at byte {offset}: {e.msg}"
+                ) from e
             return data
 
     def process_data(self) -> None:
-        """Processes and creates the objects."""
+        """Builds the objects in memory, they are inserted by the Command."""
         data = self.read_data()
 
         for json_pk, obj_values in data[self.json_keyword].items():
@@ -42,13 +59,9 @@ class Importer:
             for field, field_value in obj_values.items():
                 setattr(class_obj, field, field_value)
 
-            class_obj.save()
-
-            print(f"Created object: {json_pk} / {class_obj.base_id} / {class_obj.name}")
-
             json_template = {
                 json_pk: {
-                    'generated_id': class_obj.base_id,
+                    'instance': class_obj,
                     'relations': getattr(class_obj, "relation_fields", {}),
                     'json_kw': self.json_keyword,
                 }
@@ -56,6 +69,180 @@ class Importer:
 
             self.obj_data.update(json_template)
 
+        print(f"Read {len(self.obj_data)} {self.json_keyword}")
+
+
+class JsonObjectStream:
+    """
+    Reads the members of a JSON object incrementally.
+
+    The file is read in chunks and every member value is decoded on its own, so
+    only one record has to fit in memory at a time.
+    """
+
+    WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, json_file, chunk_size=1 << 16):
+        self.json_file = json_file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        # Bytes of the file that were dropped from the front of the buffer.
+        self.dropped_bytes = 0
+        self.encoding = getattr(json_file, 'encoding', None) or 'utf-8'
+
+    def byte_offset(self, pos=None) -> int:
+        """Position in the buffer as a byte offset into the file."""
+        pos = self.pos if pos is None else pos
+        return self.dropped_bytes + len(self.buffer[:pos].encode(self.encoding))
+
+    def error(self, message: str, pos=None) -> CommandError:
+        return CommandError(f"Invalid JSON at byte {self.byte_offset(pos)}: {message}")
+
+    def fill(self) -> bool:
+        """Appends the next chunk to the unread part of the buffer."""
+        chunk = self.json_file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.dropped_bytes = self.byte_offset()
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def next_char(self) -> str:
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.next_char()
+        if not char or char not in chars:
+            raise self.error(f"expected one of {chars!r}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self) -> Any:
+        self.next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if not self.fill():
+                    raise self.error(e.msg, e.pos) from e
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """
+        Yields the keys of the object at the current position.
+
+        The caller has to consume each member value before asking for the next key.
+        """
+        self.expect('{')
+        if self.next_char() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def items(self, json_keyword):
+        """Yields (key, value) pairs of the `json_keyword` object in the file."""
+        for key in self.members():
+            if key != json_keyword:
+                self.read_value()
+                continue
+            for json_pk in self.members():
+                yield json_pk, self.read_value()
+
+
+class StreamingImporter(Importer):
+    """
+    Imports one file in fixed-size batches with flat memory use.
+
+    Objects are inserted without their relations. The generated ids and the
+    relation edges are spooled to the temporary tables created by the Command,
+    which resolves them with set-based statements once every file is loaded.
+    """
+
+    def __init__(self, json_keyword, class_name, batch_size):
+        super().__init__(json_keyword=json_keyword, class_name=class_name)
+        self.batch_size = batch_size
+        self.count = 0
+        self.started = time.monotonic()
+
+    def read_data(self) -> Any:
+        """Yields the (json pk, values) records of the file one at a time."""
+        with open(self.abs_file_path, "r") as json_file:
+            yield from JsonObjectStream(json_file).items(self.json_keyword)
+
+    def process_data(self) -> None:
+        """Creates the objects batch by batch."""
+        batch = []
+        for json_pk, obj_values in self.read_data():
+            batch.append((json_pk, obj_values))
+            if len(batch) >= self.batch_size:
+                self.insert_batch(batch)
+                batch = []
+        if batch:
+            self.insert_batch(batch)
+
+        elapsed = time.monotonic() - self.started
+        print(f"Created {self.count} {self.json_keyword} in {elapsed:.1f}s")
+
+    def insert_batch(self, batch) -> None:
+        instances = []
+        edges = []
+        for json_pk, obj_values in batch:
+            class_obj = self.class_name()
+            for field, field_value in obj_values.items():
+                if field != 'relation_fields':
+                    setattr(class_obj, field, field_value)
+            instances.append(class_obj)
+
+            for relation_field, relation_dt in obj_values.get(
+                'relation_fields', {}
+            ).items():
+                # Empty lists and null values are skipped.
+                if not relation_dt:
+                    continue
+                targets = (
+                    relation_dt if isinstance(relation_dt, list) else [relation_dt]
+                )
+                for target in targets:
+                    edges.append((self.json_keyword, relation_field, json_pk, target))
+
+        self.class_name.bulk_insert(instances, batch_size=self.batch_size)
+
+        with connection.cursor() as cursor:
+            with cursor.copy(
+                "COPY import_ids (json_pk, generated_id) FROM STDIN"
+            ) as copy:
+                for (json_pk, _), class_obj in zip(batch, instances):
+                    copy.write_row((json_pk, class_obj.pk))
+            with cursor.copy(
+                "COPY import_edges (json_kw, field, source, target) FROM STDIN"
+            ) as copy:
+                for edge in edges:
+                    copy.write_row(edge)
+
+        self.count += len(instances)
+        elapsed = time.monotonic() - self.started
+        print(
+            f"{self.json_keyword}: {self.count} objects, "
+            f"{self.count / max(elapsed, 1e-6):.0f} objects/s"
+        )
+
 
 class Command(BaseCommand):
     help = 'This importer runs everything.'
@@ -76,40 +263,197 @@ class Command(BaseCommand):
 
     def fetch_relation(self, obj_pk: str) -> Any:
         """Shared logic for fetching relation objects."""
-        rel_pk = self.all_objs[obj_pk]
-        return self.references[rel_pk['json_kw']].objects.get(pk=rel_pk['generated_id'])
+        return self.all_objs[obj_pk]['instance']
 
-    def relation_handler(self) -> None:
-        """Core logic for establishing relations."""
+    def relation_handler(self) -> dict:
+        """
+        Core logic for establishing relations.
+
+        Every object already has its generated id, so foreign keys are set on the
+        instances before they are inserted. Many-to-many values are collected per
+        model and field as {object id: [related ids]} for bulk_set_relations.
+        """
+        m2m_values = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
 
         for json_pk, pk_data in self.all_objs.items():
-            # Example: {'lcn_1': {'generated_id': 'lcn-9ss-3vSpN8w', 'relations': {'contract': 'con_1'}}}
+            # Example: {'lcn_1': {'instance': <License>, 'relations': {'contract': 'con_1'}}}
 
-            main_obj = self.references[pk_data['json_kw']].objects.get(
-                pk=pk_data['generated_id']
-            )
+            main_obj = pk_data['instance']
             for relation_field, relation_dt in pk_data['relations'].items():
                 # Example: 'relations': {'contract': 'con_1'}
 
-                if relation_dt:
+                if not relation_dt:
                     # Ignore empty lists and null values.
-                    if isinstance(relation_dt, list):
-                        for obj_pk in relation_dt:
-                            # Handle multiple objects. Example: ['ser_1', 'ser_2']
-                            getattr(main_obj, relation_field).add(
-                                self.fetch_relation(obj_pk)
-                            )
-                    else:
-                        # Handle single objects. Example: 'srv_1'
-                        setattr(
-                            main_obj, relation_field, self.fetch_relation(relation_dt)
-                        )
-            main_obj.save()
-            print(f"Successfully established all relations for {json_pk}")
+                    continue
+
+                field = main_obj._meta.get_field(relation_field)
+                if not isinstance(relation_dt, list):
+                    # Handle single objects. Example: 'srv_1'
+                    setattr(
+                        main_obj, field.attname, self.fetch_relation(relation_dt).pk
+                    )
+                    continue
+
+                # Handle multiple objects. Example: ['ser_1', 'ser_2']
+                related_objs = [self.fetch_relation(obj_pk) for obj_pk in relation_dt]
+                if field.one_to_many:
+                    # Reverse side of a foreign key, set on the related objects.
+                    for related_obj in related_objs:
+                        setattr(related_obj, field.field.attname, main_obj.pk)
+                elif field.auto_created:
+                    # Reverse side of a many-to-many, stored on the other model.
+                    relations = m2m_values[field.related_model][field.field.name]
+                    for related_obj in related_objs:
+                        relations[related_obj.pk].append(main_obj.pk)
+                else:
+                    relations = m2m_values[type(main_obj)][field.name]
+                    relations[main_obj.pk] += [obj.pk for obj in related_objs]
+
+        return m2m_values
+
+    def insert_objects(self) -> None:
+        """Inserts all objects and relations, one bulk statement per table."""
+        objs_by_model = defaultdict(list)
+        for pk_data in self.all_objs.values():
+            assign_base_id(pk_data['instance'])
+            objs_by_model[type(pk_data['instance'])].append(pk_data['instance'])
+
+        m2m_values = self.relation_handler()
+
+        # Foreign key constraints are deferred until the end of the transaction, so
+        # the tables can be loaded in any order.
+        with transaction.atomic():
+            for model, objs in objs_by_model.items():
+                model.objects.bulk_create(objs, batch_size=settings.BULK_BATCH_SIZE)
+                print(f"Created {len(objs)} {model._meta.verbose_name_plural}")
+
+            for model, relations in m2m_values.items():
+                model.bulk_set_relations(relations, batch_size=settings.BULK_BATCH_SIZE)
+                print(f"Established relations for {model._meta.verbose_name_plural}")
+
+            dependency_closure.rebuild()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse the files incrementally and insert in batches, for large dumps.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.BULK_BATCH_SIZE,
+            help='Objects per insert batch in streaming mode.',
+        )
+
+    def stream_import(self, batch_size: int) -> None:
+        """Streams every file into the database and resolves relations in SQL."""
+        started = time.monotonic()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE import_ids ("
+                "json_pk text PRIMARY KEY, generated_id text NOT NULL"
+                ") ON COMMIT DROP"
+            )
+            cursor.execute(
+                "CREATE TEMP TABLE import_edges ("
+                "json_kw text, field text, source text, target text"
+                ") ON COMMIT DROP"
+            )
+
+            for json_reference, reference_model in self.references.items():
+                StreamingImporter(
+                    json_keyword=json_reference,
+                    class_name=reference_model,
+                    batch_size=batch_size,
+                ).process_data()
+
+            # Temporary tables are not analyzed automatically.
+            cursor.execute("ANALYZE import_ids")
+            cursor.execute("ANALYZE import_edges")
+            self.resolve_spooled_relations(cursor)
+            dependency_closure.rebuild()
+
+        print(f"Streaming import took {time.monotonic() - started:.1f}s")
+
+    def resolve_spooled_relations(self, cursor) -> None:
+        """Sets foreign keys and fills through tables from the spooled edges."""
+        cursor.execute(
+            "SELECT e.source, e.target FROM import_edges e "
+            "LEFT JOIN import_ids i ON i.json_pk = e.target "
+            "WHERE i.json_pk IS NULL LIMIT 1"
+        )
+        unknown = cursor.fetchone()
+        if unknown is not None:
+            raise CommandError(f"{unknown[0]} refers to unknown object {unknown[1]}")
+
+        quote = connection.ops.quote_name
+        edges = (
+            "FROM import_edges e "
+            "JOIN import_ids src ON src.json_pk = e.source "
+            "JOIN import_ids tgt ON tgt.json_pk = e.target "
+            "WHERE e.json_kw = %s AND e.field = %s"
+        )
+
+        cursor.execute("SELECT DISTINCT json_kw, field FROM import_edges")
+        for json_kw, relation_field in cursor.fetchall():
+            field = self.references[json_kw]._meta.get_field(relation_field)
+
+            if field.many_to_one or field.one_to_many:
+                # The foreign key column is on this model, or on the related model
+                # for the reverse side.
+                if field.many_to_one:
+                    table, column, value, match = field.model, field, 'tgt', 'src'
+                else:
+                    table, column, value, match = (
+                        field.related_model,
+                        field.field,
+                        'src',
+                        'tgt',
+                    )
+                cursor.execute(
+                    f"UPDATE {quote(table._meta.db_table)} AS t "
+                    f"SET {quote(column.column)} = {value}.generated_id "
+                    f"{edges} AND t.{quote(table._meta.pk.column)} = {match}.generated_id",
+                    [json_kw, relation_field],
+                )
+                continue
+
+            # Many-to-many: the reverse side is stored with the columns swapped.
+            forward = field if not field.auto_created else field.field
+            source, target = ('src', 'tgt') if forward is field else ('tgt', 'src')
+            through = forward.remote_field.through
+            source_column = through._meta.get_field(forward.m2m_field_name()).column
+            target_column = through._meta.get_field(
+                forward.m2m_reverse_field_name()
+            ).column
+            pairs = f"SELECT {source}.generated_id, {target}.generated_id {edges}"
+            params = [json_kw, relation_field]
+            if (
+                forward.remote_field.symmetrical
+                and forward.related_model is forward.model
+            ):
+                # Symmetrical self relations are stored in both directions.
+                pairs += f" UNION SELECT {target}.generated_id, {source}.generated_id {edges}"
+                params *= 2
+            cursor.execute(
+                f"INSERT INTO {quote(through._meta.db_table)} "
+                f"({quote(source_column)}, {quote(target_column)}) "
+                f"{pairs} ON CONFLICT DO NOTHING",
+                params,
+            )
+        print("Established all relations")
 
     def handle(self, *args, **options) -> None:
         """Handle function. Called first when ran."""
 
+        if options['stream']:
+            self.stream_import(batch_size=options['batch_size'])
+            invalidate_server_impact()
+            print("Importer completed.")
+            return
+
         for json_reference, reference_model in self.references.items():
             import_class = Importer(
                 json_keyword=json_reference, class_name=reference_model
@@ -118,5 +462,16 @@ class Command(BaseCommand):
 
             self.all_objs.update(import_class.obj_data)
 
-        self.relation_handler()
+        # The whole import is retried with fresh ids on a base_id collision.
+        for _ in range(BaseModel.BASE_ID_RETRIES):
+            try:
+                self.insert_objects()
+                break
+            except IntegrityError as e:
+                if not is_base_id_conflict(e):
+                    raise
+        else:
+            raise TokenGenerationException
+
+        invalidate_server_impact()
         print("Importer completed.")
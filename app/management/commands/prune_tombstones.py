@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+from app.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Deletes the change feed tombstones that are older than the retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.TOMBSTONE_RETENTION_DAYS,
+            help='Keep the tombstones of this many days.',
+        )
+
+    def handle(self, *args, **options) -> None:
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = Tombstone.objects.filter(deleted_time__lt=cutoff).delete()
+        print(f"Pruned {deleted} tombstones older than {cutoff:%Y-%m-%d %H:%M}")
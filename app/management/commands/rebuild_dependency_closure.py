@@ -0,0 +1,18 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from app.closure import dependency_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the dependency closure table from the dependency relations.'
+
+    def handle(self, *args, **options) -> None:
+        started = time.monotonic()
+        with transaction.atomic():
+            rows = dependency_closure.rebuild()
+        print(
+            f"Rebuilt dependency closure: {rows} rows "
+            f"in {time.monotonic() - started:.1f}s"
+        )
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from app.closure import keyword_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the keyword closure table from the broader/narrower relations.'
+
+    def handle(self, *args, **options) -> None:
+        started = time.monotonic()
+        with transaction.atomic():
+            rows = keyword_closure.rebuild()
+        print(
+            f"Rebuilt keyword closure: {rows} rows "
+            f"in {time.monotonic() - started:.1f}s"
+        )
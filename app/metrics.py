@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LABELS = ('route', 'method')
+# Requests that matched no URL pattern share one label value, so that scanners
+# cannot blow up the number of series.
+UNMATCHED_ROUTE = '<unmatched>'
+
+REQUESTS = Counter(
+    'http_requests_total', 'Requests by route, method and status.', LABELS + ('status',)
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Time from the request to the response headers.',
+    LABELS,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_sql_queries',
+    'SQL queries run per request.',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_SQL_TIME = Histogram(
+    'http_request_sql_duration_seconds',
+    'Time spent in SQL queries per request.',
+    LABELS,
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Size of the response body, after compression. Streamed bodies are not counted.',
+    LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+
+class RequestStats:
+    """SQL queries of one request, also from the threads it prefetches in."""
+
+    def __init__(self, request):
+        self.request = request
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def add(self, duration):
+        with self.lock:
+            self.queries += 1
+            self.sql_time += duration
+
+
+# Copied into the sync_to_async threads of a request along with the rest of
+# the context, so their queries are counted too.
+request_stats = ContextVar('request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(time.perf_counter() - start)
+
+
+def install_query_recorder(connection):
+    """Time the queries of a connection. The wrapper stays when it reconnects."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def request_route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.route is None:
+        return UNMATCHED_ROUTE
+    return match.route
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, SQL query count, SQL time and response size of each
+    request, labelled by URL pattern and method.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(request)
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(request)
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, stats, duration):
+        labels = (request_route(request), request.method)
+        REQUESTS.labels(*labels, response.status_code).inc()
+        REQUEST_LATENCY.labels(*labels).observe(duration)
+        REQUEST_QUERIES.labels(*labels).observe(stats.queries)
+        REQUEST_SQL_TIME.labels(*labels).observe(stats.sql_time)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+
+
+def metrics_registry():
+    """
+    The registry to export. With PROMETHEUS_MULTIPROC_DIR set, e.g. by
+    gunicorn.conf.py, every worker writes its samples there and they are summed
+    across the workers, including those of exited workers folded into the
+    archive files.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics(request):
+    """The metrics in the Prometheus text format, behind METRICS_TOKEN if set."""
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        if not constant_time_compare(authorization, f'Bearer {settings.METRICS_TOKEN}'):
+            return HttpResponseForbidden()
+    try:
+        output = generate_latest(metrics_registry())
+    except FileNotFoundError:
+        # The files of an exited worker were folded into the archive meanwhile.
+        output = generate_latest(metrics_registry())
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
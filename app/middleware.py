@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepts_brotli(accept_encoding):
+    """Whether an Accept-Encoding header lists br with a non-zero q-value."""
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() != 'br':
+            continue
+        params = params.replace(' ', '')
+        if not params.startswith('q='):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses of at least COMPRESSION_MIN_SIZE bytes with brotli when the
+    client accepts it and the brotli package is installed, with gzip otherwise.
+    """
+
+    # Brotli quality, 4-5 compresses better than gzip at a similar speed.
+    brotli_quality = 5
+    uncompressed_types = ('text/event-stream', 'text/html')
+
+    def process_response(self, request, response):
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        # Event streams are flushed per event, compression would hold them back.
+        # HTML pages, e.g. of the browsable API, carry the CSRF token and are
+        # not compressed against BREACH.
+        if response.get('Content-Type', '').startswith(self.uncompressed_types):
+            return response
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if (
+            brotli is None
+            or (response.streaming and response.is_async)
+            or not accepts_brotli(accept_encoding)
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            response.streaming_content = self.compress_sequence(
+                response.streaming_content
+            )
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(
+                response.content, quality=self.brotli_quality
+            )
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # Same as GZipMiddleware, a compressed representation has a weak ETag.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    def compress_sequence(self, sequence):
+        compressor = brotli.Compressor(quality=self.brotli_quality)
+        for chunk in sequence:
+            data = compressor.process(chunk)
+            # Flush so that every chunk reaches the client when it is produced.
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
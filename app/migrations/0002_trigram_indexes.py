@@ -0,0 +1,134 @@
+# Generated by Django 4.2 on 2026-10-18 18:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='application_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='application_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['product_owner'], name='application_owner_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['application_holder'], name='application_holder_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='contract_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='contract_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customership',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='customership_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customership',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='customership_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='directory',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='directory_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='directory',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='directory_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='integration',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='integration_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='integration',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='integration_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keyword',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='keyword_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keyword',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='keyword_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keywordlabel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='keywordlabel_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keywordlabel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='keywordlabel_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keywordset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='keywordset_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='keywordset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='keywordset_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='license',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='license_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='license',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='license_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='provider',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='provider_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='provider',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='provider_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='server_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='server_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['server_role'], name='server_role_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['product_owner'], name='server_owner_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['dns_names'], name='server_dns_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ip_address'], name='server_ip_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='service_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='service_desc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0002_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="application",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="contract",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="customership",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="directory",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="integration",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="keyword",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="keywordlabel",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="keywordset",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="license",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="provider",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="service",
+            name="base_token",
+            field=models.CharField(max_length=16, unique=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_unique_base_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DependencyClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ancestor", models.CharField(max_length=20)),
+                ("descendant", models.CharField(max_length=20)),
+                ("depth", models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="dependencyclosure",
+            index=models.Index(
+                fields=["descendant"], name="dependencyclosure_desc_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dependencyclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="dependencyclosure_unique"
+            ),
+        ),
+    ]
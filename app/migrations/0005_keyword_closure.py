@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_dependency_closure"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KeywordClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ancestor", models.CharField(max_length=20)),
+                ("descendant", models.CharField(max_length=20)),
+                ("depth", models.PositiveIntegerField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name="keywordclosure",
+            index=models.Index(fields=["descendant"], name="keywordclosure_desc_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="keywordclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="keywordclosure_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_keyword_closure"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("base_id", models.CharField(max_length=20)),
+                ("id_prefix", models.CharField(max_length=5)),
+                (
+                    "deleted_time",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="tombstone",
+            index=models.Index(
+                fields=["id_prefix", "deleted_time", "base_id"],
+                name="tombstone_feed_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,149 @@
+# Generated by Django 4.2 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0006_tombstone"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="application",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="contract",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="customership",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="directory",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="integration",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="keyword",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="keywordlabel",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="keywordset",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="license",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="provider",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="service",
+            name="last_modified_time",
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="application",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"],
+                name="application_modified_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="contract",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="contract_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customership",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"],
+                name="customership_modified_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="directory",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="directory_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="integration",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"],
+                name="integration_modified_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="keyword",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="keyword_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="keywordlabel",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"],
+                name="keywordlabel_modified_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="keywordset",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="keywordset_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="license",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="license_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="provider",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="provider_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="server",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="server_modified_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="service",
+            index=models.Index(
+                fields=["last_modified_time", "base_id"], name="service_modified_idx"
+            ),
+        ),
+    ]
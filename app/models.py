@@ -1,4 +1,12 @@
-from django.db import models
+from contextlib import nullcontext
+
+from django.contrib.postgres.indexes import GinIndex
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .exceptions import TokenGenerationException
+from .utils import assign_base_id, is_base_id_conflict
 
 
 class BaseModel(models.Model):
@@ -47,14 +55,12 @@ class BaseModel(models.Model):
     ]
 
     base_id = models.CharField(primary_key=True, max_length=20)
-    base_token = models.CharField(max_length=16)
+    base_token = models.CharField(max_length=16, unique=True)
     id_prefix = models.CharField(max_length=5)
     name = models.CharField(max_length=80)
     description = models.CharField(max_length=1000, null=True, blank=True)
     created_time = models.DateTimeField(null=True, blank=True, auto_now_add=True)
-    last_modified_time = models.DateTimeField(
-        null=True, blank=True, auto_now=True, db_index=True
-    )
+    last_modified_time = models.DateTimeField(null=True, blank=True, auto_now=True)
     visibility = models.CharField(
         max_length=140,
         choices=VISIBILITY_TYPES,
@@ -64,10 +70,145 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [
+            # Serves the keyset pagination and the change feed, which order and
+            # compare by (last_modified_time, base_id), and ?modified_since=.
+            models.Index(
+                fields=['last_modified_time', 'base_id'],
+                name='%(class)s_modified_idx',
+            ),
+            # Trigram indexes that serve the FieldsFilter similarity lookups.
+            GinIndex(
+                fields=['name'],
+                name='%(class)s_name_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+            GinIndex(
+                fields=['description'],
+                name='%(class)s_desc_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
+
+    # How many fresh base_ids are tried before giving up on an insert.
+    BASE_ID_RETRIES = 5
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Insert new objects without looking them up first.
+
+        The pre_save signal assigns a new base_id on every attempt, so a base_id
+        collision is retried instead of looked up in advance.
+        """
+        if self._state.adding and self.pk and not args:
+            # An explicit base_id, e.g. Model(pk=..., ...).save(), updates the
+            # object if it exists, like a plain Django save.
+            using = kwargs.get('using') or router.db_for_write(
+                type(self), instance=self
+            )
+            if type(self)._default_manager.using(using).filter(pk=self.pk).exists():
+                self._state.adding = False
+                if not self.base_token:
+                    self.id_prefix, _, self.base_token = self.pk.partition('-')
+
+        if not self._state.adding or args:
+            return super().save(*args, **kwargs)
+
+        # The primary key is already set, skip Django's UPDATE-then-INSERT probe.
+        kwargs.setdefault('force_insert', True)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+
+        for _ in range(self.BASE_ID_RETRIES):
+            # A failed INSERT inside a transaction must be rolled back to a savepoint.
+            if connections[using].in_atomic_block:
+                savepoint = transaction.atomic(using=using)
+            else:
+                savepoint = nullcontext()
+            try:
+                with savepoint:
+                    return super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if not is_base_id_conflict(e):
+                    raise
+        raise TokenGenerationException
+
+    @classmethod
+    def bulk_insert(cls, instances, batch_size=None):
+        """
+        Insert new objects with bulk_create.
+
+        bulk_create skips the pre_save signal, so the base_ids are assigned here,
+        and the whole batch is retried with fresh ids on a base_id collision.
+        """
+        using = router.db_for_write(cls)
+
+        for _ in range(cls.BASE_ID_RETRIES):
+            for instance in instances:
+                assign_base_id(instance)
+            try:
+                with transaction.atomic(using=using):
+                    return cls.objects.using(using).bulk_create(
+                        instances, batch_size=batch_size
+                    )
+            except IntegrityError as e:
+                if not is_base_id_conflict(e):
+                    raise
+        raise TokenGenerationException
+
+    @classmethod
+    def bulk_set_relations(cls, relations, replace=False, batch_size=None):
+        """
+        Write many-to-many values of many objects with one insert per field.
+
+        `relations` maps a many-to-many field name to {object pk: related objects
+        or pks}. With replace the current values of those objects are deleted
+        first, like `set()` does for a single object.
+
+        No m2m_changed signals are sent, the last_modified_time of the related
+        objects that gain or lose a relation is bumped here instead.
+        """
+        for field_name, values in relations.items():
+            field = cls._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            # Self relations without symmetrical=False are stored in both directions.
+            symmetrical = field.remote_field.symmetrical and field.related_model is cls
+
+            related_pks = {
+                getattr(obj, 'pk', obj)
+                for related in values.values()
+                for obj in related
+            }
+            changed = Q(pk__in=related_pks)
+            if replace:
+                existing = Q(**{f'{source}__in': list(values)})
+                if symmetrical:
+                    existing |= Q(**{f'{target}__in': list(values)})
+                changed |= Q(pk__in=through.objects.filter(existing).values(target))
+            field.related_model.objects.filter(changed).update(
+                last_modified_time=timezone.now()
+            )
+            if replace:
+                through.objects.filter(existing).delete()
+
+            rows = []
+            for pk, related in values.items():
+                for related_pk in (getattr(obj, 'pk', obj) for obj in related):
+                    rows.append(
+                        through(**{f'{source}_id': pk, f'{target}_id': related_pk})
+                    )
+                    if symmetrical:
+                        rows.append(
+                            through(**{f'{source}_id': related_pk, f'{target}_id': pk})
+                        )
+            through.objects.bulk_create(
+                rows, batch_size=batch_size, ignore_conflicts=True
+            )
+
 
 class Customership(BaseModel):
     model_prefix = 'cus'
@@ -129,6 +270,8 @@ class Keyword(BaseModel):
 
 
 class KeywordSet(BaseModel):
+    model_prefix = 'kws'
+
     ANY = 'any'
     APPLICATION = 'application'
 
@@ -464,6 +607,20 @@ class Application(BaseModel):
         db_column='file_url', blank=True, null=True, upload_to='application/'
     )
 
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            GinIndex(
+                fields=['product_owner'],
+                name='application_owner_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+            GinIndex(
+                fields=['application_holder'],
+                name='application_holder_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
+
 
 class Service(BaseModel):
     model_prefix = 'ser'
@@ -644,11 +801,35 @@ class Server(BaseModel):
         Application, blank=True, related_name='servers'
     )
 
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            GinIndex(
+                fields=['server_role'],
+                name='server_role_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+            GinIndex(
+                fields=['product_owner'],
+                name='server_owner_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+            GinIndex(
+                fields=['dns_names'],
+                name='server_dns_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+            GinIndex(
+                fields=['ip_address'],
+                name='server_ip_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
+
 
 class Directory(BaseModel):
     model_prefix = 'dir'
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         verbose_name = 'Directory'
         verbose_name_plural = 'Directories'
 
@@ -659,6 +840,64 @@ class Directory(BaseModel):
     servers = models.ManyToManyField(Server, blank=True, related_name='directories')
 
 
+class BaseClosure(models.Model):
+    """
+    Transitive closure of a graph made by many-to-many relations.
+
+    One row for every pair where `ancestor` reaches `descendant` directly or
+    through other objects, with the length of the shortest path as `depth`.
+    Maintained by app/closure.py.
+    """
+
+    ancestor = models.CharField(max_length=20)
+    descendant = models.CharField(max_length=20)
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ancestor', 'descendant'], name='%(class)s_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['descendant'], name='%(class)s_desc_idx'),
+        ]
+
+
+class DependencyClosure(BaseClosure):
+    """
+    Applications and services (`ancestor`) and everything they depend on
+    (`descendant`). See also `manage.py rebuild_dependency_closure`.
+    """
+
+
+class KeywordClosure(BaseClosure):
+    """
+    Keywords (`ancestor`) and all of their narrower concepts (`descendant`). See
+    also `manage.py rebuild_keyword_closure`.
+    """
+
+
+class Tombstone(models.Model):
+    """
+    A deleted object, reported by the change feed of its endpoint. See also
+    `manage.py prune_tombstones`.
+    """
+
+    base_id = models.CharField(max_length=20)
+    id_prefix = models.CharField(max_length=5)
+    deleted_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id_prefix', 'deleted_time', 'base_id'],
+                name='tombstone_feed_idx',
+            ),
+        ]
+
+
 '''
 
 class Costs(BaseModel):
@@ -1,4 +1,15 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.paginator import InvalidPage
+from django.db.models import DateTimeField, F, Field, Func, Q, Value
+from django.db.models.lookups import LessThan
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .utils import is_valid_int
 
 
 class CustomPageNumberPagination(pagination.PageNumberPagination):
@@ -6,3 +17,156 @@ class CustomPageNumberPagination(pagination.PageNumberPagination):
     page_size_query_param = 'count'
     max_page_size = 20
     page_query_param = 'page'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the count and the page read by the async ORM."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached property, the page no longer needs a query.
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return self.page.object_list
+
+
+class Row(Func):
+    """A row value such as (last_modified_time, base_id), compared as a whole."""
+
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor (keyset) pagination over (last_modified_time, base_id).
+
+    Pages are selected with a `WHERE (last_modified_time, base_id) < cursor`
+    row comparison, which the (last_modified_time, base_id) index scans from the
+    cursor on, instead of an OFFSET. No COUNT(*) query is run, so every page
+    costs the same as the first one.
+
+    Examples:
+    1) {endpoint}/?cursor=            first page
+    2) {endpoint}/?cursor=<next>      following pages, use the `next` link
+    """
+
+    page_size = 20
+    page_size_query_param = 'count'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # NULLs first, as a backward scan of the (last_modified_time, base_id) index does.
+    ordering = (F('last_modified_time').desc(nulls_first=True), '-base_id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, page_size = self.page_queryset(queryset, request)
+        return self.set_page(list(queryset), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the page read by the async ORM."""
+        queryset, page_size = self.page_queryset(queryset, request)
+        return self.set_page([obj async for obj in queryset], page_size)
+
+    def page_queryset(self, queryset, request):
+        """Return the query of the page and the page size."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(*position))
+
+        # Fetch one extra row to know whether a next page exists.
+        return queryset[: page_size + 1], page_size
+
+    def set_page(self, results, page_size):
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        page_size = is_valid_int(
+            request.query_params.get(self.page_size_query_param, '')
+        )
+        if page_size:
+            return min(page_size, self.max_page_size)
+        return self.page_size
+
+    def position_filter(self, last_modified_time, base_id):
+        """Rows that come after the given position in the descending ordering."""
+        if last_modified_time is None:
+            return Q(last_modified_time__isnull=False) | Q(
+                last_modified_time__isnull=True, base_id__lt=base_id
+            )
+        # Rows with a NULL last_modified_time compare as NULL and are left out.
+        return LessThan(
+            Row('last_modified_time', 'base_id'),
+            Row(Value(last_modified_time, DateTimeField()), Value(base_id)),
+        )
+
+    def encode_cursor(self, obj):
+        modified = obj.last_modified_time.isoformat() if obj.last_modified_time else ''
+        token = f'{modified}|{obj.base_id}'
+        return urlsafe_b64encode(token.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            modified, base_id = (
+                urlsafe_b64decode(encoded.encode()).decode().split('|', 1)
+            )
+            last_modified_time = parse_datetime(modified) if modified else None
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if modified and last_modified_time is None:
+            raise NotFound(self.invalid_cursor_message)
+        return last_modified_time, base_id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                'next': self.get_next_link(),
+                'results': data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
@@ -0,0 +1,239 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .nested import NestedBaseSerializer
+
+# The lookups one serializer field needs. `limited` marks the nested relations that
+# are rendered through BaseSerializer.process_nested_objects and honour
+# nested_max_count.
+FieldPlan = namedtuple('FieldPlan', ['select_related', 'prefetch_related', 'limited'])
+
+
+def nested_serializer_for(model):
+    """Return the Nested*Serializer used to render objects of the given model."""
+    for nested_class in NestedBaseSerializer.__subclasses__():
+        if nested_class.Meta.model is model:
+            return nested_class
+
+
+def field_lookups(model, field, prefix=''):
+    """
+    Return the (select_related, prefetch_related) lookups a serializer field needs.
+
+    SerializerMethodField relations are resolved to the Nested*Serializer of the
+    related model, nested serializers are followed recursively, plain primary key
+    relations only need a prefetch for the many side.
+    """
+    if field.write_only:
+        return [], []
+
+    if isinstance(field, serializers.SerializerMethodField):
+        source = field.field_name
+    elif field.source == '*':
+        return [], []
+    else:
+        source = field.source.replace('.', '__')
+
+    try:
+        model_field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return [], []
+    if not model_field.is_relation:
+        return [], []
+
+    lookup = f'{prefix}{source}'
+    many = model_field.many_to_many or model_field.one_to_many
+
+    if isinstance(field, serializers.SerializerMethodField):
+        nested_class = nested_serializer_for(model_field.related_model)
+    elif isinstance(field, serializers.ListSerializer):
+        nested_class = type(field.child)
+    elif isinstance(field, serializers.BaseSerializer):
+        nested_class = type(field)
+    else:
+        nested_class = None
+
+    if many:
+        select_related, prefetch_related = [], [lookup]
+    elif (
+        isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization()
+    ):
+        # Rendered from the local foreign key column, no query needed.
+        return [], []
+    else:
+        select_related, prefetch_related = [lookup], []
+
+    if nested_class is not None:
+        for nested_field in nested_class().fields.values():
+            nested_select, nested_prefetch = field_lookups(
+                model_field.related_model, nested_field, prefix=f'{lookup}__'
+            )
+            if many:
+                # Everything below a prefetched relation is prefetched as well.
+                prefetch_related += nested_select + nested_prefetch
+            else:
+                select_related += nested_select
+                prefetch_related += nested_prefetch
+
+    return select_related, prefetch_related
+
+
+def limited_prefetch_attr(field_name):
+    """Attribute that holds the per-parent limited prefetch of a nested relation."""
+    return f'{field_name}_limited'
+
+
+class PrefetchPlan:
+    """
+    The fields a serializer renders and the lookups each relation field needs.
+
+    Built once per serializer with `build_prefetch_plan`. `select` narrows the
+    fields for the ?fields= / ?expand= query parameters and `apply` turns the
+    selection into .only(), select_related() and prefetch_related() calls.
+    """
+
+    def __init__(self, model, field_names, expandable, relations):
+        self.model = model
+        self.field_names = field_names
+        # Relations that are rendered as nested objects and can be expanded.
+        self.expandable = expandable
+        # Field name -> FieldPlan for every field that renders a relation.
+        self.relations = relations
+
+    def select(self, fields=None, expand=None):
+        """
+        Return the names of the fields to render, or None for all of them.
+
+        `fields` picks the fields, `expand` picks which nested relations are
+        rendered on top of them. Unknown names are rejected, so that a typo does
+        not quietly return partial objects.
+        """
+        if fields is None and expand is None:
+            return None
+
+        unknown = set(fields or ()) - set(self.field_names)
+        if unknown:
+            raise ValidationError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        unknown = set(expand or ()) - self.expandable
+        if unknown:
+            raise ValidationError(
+                f'Unknown expandable relations: {", ".join(sorted(unknown))}'
+            )
+
+        selected = set(self.field_names)
+        if fields is not None:
+            selected &= set(fields)
+        if expand is not None:
+            selected -= self.expandable
+            selected |= self.expandable & set(expand)
+        return selected
+
+    def only_fields(self, field_names):
+        """Concrete model columns needed to render the selected fields."""
+        columns = {self.model._meta.pk.name, 'last_modified_time'}
+        for field_name in field_names:
+            try:
+                model_field = self.model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(field_name)
+        return columns
+
+    def lookups(self, field_names=None, nested_max_count=None):
+        """
+        Return the (select_related, prefetch_related) lookups of the selected
+        fields (all fields if None).
+
+        With nested_max_count the nested many-relations are prefetched with a
+        per-parent limit (a ROW_NUMBER() window in the same query), so every
+        relation costs one query per page instead of one query per row. The
+        limited rows are stored in `limited_prefetch_attr(field_name)` lists.
+        """
+        select_related = []
+        prefetch_related = []
+
+        for field_name, field_plan in self.relations.items():
+            if field_names is not None and field_name not in field_names:
+                continue
+
+            select_related += field_plan.select_related
+
+            if not field_plan.limited or nested_max_count is None:
+                prefetch_related += field_plan.prefetch_related
+                continue
+
+            to_attr = limited_prefetch_attr(field_name)
+            related_model = self.model._meta.get_field(field_name).related_model
+            related_queryset = related_model._default_manager.order_by(
+                '-last_modified_time'
+            )[:nested_max_count]
+            prefetch_related.append(
+                Prefetch(field_name, queryset=related_queryset, to_attr=to_attr)
+            )
+            # Deeper lookups continue from the limited objects that get rendered.
+            for lookup in field_plan.prefetch_related:
+                if lookup.startswith(f'{field_name}__'):
+                    prefetch_related.append(to_attr + lookup[len(field_name) :])
+        return select_related, prefetch_related
+
+    def narrow(self, queryset, field_names=None):
+        """Load only the columns the selected fields (all fields if None) need."""
+        if field_names is not None:
+            queryset = queryset.only(*self.only_fields(field_names))
+        return queryset
+
+    def apply(self, queryset, field_names=None, nested_max_count=None):
+        """Apply the plan for the selected fields to the queryset, see lookups()."""
+        select_related, prefetch_related = self.lookups(field_names, nested_max_count)
+        queryset = self.narrow(queryset, field_names)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def build_prefetch_plan(serializer_class):
+    """
+    Derive the select_related/prefetch_related plan from a serializer's fields.
+
+    Every field that renders a relation gets a FieldPlan, so that adding a field
+    to a serializer never adds per-row queries. Plans are built once per
+    serializer class and shared.
+    """
+    model = serializer_class.Meta.model
+    fields = serializer_class().fields
+    relations = {}
+    for field_name, field in fields.items():
+        select_related, prefetch_related = field_lookups(model, field)
+        if select_related or prefetch_related:
+            relations[field_name] = FieldPlan(
+                select_related=tuple(select_related),
+                prefetch_related=tuple(prefetch_related),
+                limited=isinstance(field, serializers.SerializerMethodField),
+            )
+
+    return PrefetchPlan(
+        model=model,
+        field_names=tuple(fields),
+        expandable=expandable_fields(fields),
+        relations=relations,
+    )
+
+
+def expandable_fields(fields):
+    """Names of the fields that render relations as nested objects."""
+    return {
+        field_name
+        for field_name, field in fields.items()
+        if isinstance(
+            field, (serializers.SerializerMethodField, serializers.BaseSerializer)
+        )
+    }
@@ -0,0 +1,39 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer on orjson, which encodes large nested pages several times faster.
+
+    Falls back to DRF's JSONRenderer if orjson is not installed and for indent
+    widths other than two. Otherwise the output decodes to the same data as
+    with DRF: datetimes in UTC end in Z, non-string keys are converted, U+2028
+    and U+2029 are escaped and types orjson does not know are handed to DRF's
+    JSONEncoder. Indented output has no spaces before line breaks, and NaN and
+    infinities are rendered as null instead of raising.
+    """
+
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent not in (None, 2):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = self.options | (orjson.OPT_INDENT_2 if indent else 0)
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=options)
+        # Like DRF, escape the line separators that are not valid in JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
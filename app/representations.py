@@ -0,0 +1,289 @@
+import asyncio
+import time
+from functools import lru_cache
+from hashlib import md5
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Q, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework import serializers
+
+from .models import BaseModel
+from .nested import NestedBaseSerializer
+from .prefetch import build_prefetch_plan
+from .routers import primary_reads
+from .utils import query_param_validator
+
+CACHE_PREFIX = 'representation'
+
+
+def version_key(base_id):
+    return f'{CACHE_PREFIX}:version:{base_id}'
+
+
+def new_version():
+    return f'{int(time.time())}-{uuid4().hex}'
+
+
+def version_time(version):
+    """The UNIX time the version token was created at."""
+    created, _, _ = version.partition('-')
+    return int(created) if created.isdigit() else None
+
+
+def representation_versions(base_ids):
+    """
+    Return {base_id: version token}. The token is part of the cache keys of the
+    object's representations, deleting it drops all of them at once.
+    """
+    keys = {version_key(base_id): base_id for base_id in base_ids}
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def expire_representations(base_ids):
+    """Drop the cached representations of the objects once the transaction commits."""
+    keys = [version_key(base_id) for base_id in base_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@lru_cache(maxsize=None)
+def nested_relations():
+    """
+    {model: relation fields} rendered inside the nested serializers, e.g. the
+    narrower and broader concepts of a keyword listed in a keyword set.
+    """
+    relations = {}
+    for serializer in NestedBaseSerializer.__subclasses__():
+        model = serializer.Meta.model
+        fields = [
+            model._meta.get_field(name)
+            for name in serializer.Meta.fields
+            if model._meta.get_field(name).is_relation
+        ]
+        if fields:
+            relations[model] = fields
+    return relations
+
+
+def related_base_ids(model, pks):
+    """
+    One query for the objects related to the given objects in either direction,
+    i.e. the objects whose nested relations may render them. Hidden reverse
+    relations, e.g. the keywords that list a keyword as narrower, are included.
+    """
+    querysets = []
+    for field in model._meta.get_fields(include_hidden=True):
+        if not field.is_relation or field.related_model is None:
+            continue
+        if not issubclass(field.related_model, BaseModel):
+            continue
+        if field.concrete:
+            queryset = model.objects.filter(
+                pk__in=pks, **{f'{field.name}__isnull': False}
+            ).values_list(field.name, flat=True)
+        else:
+            queryset = field.related_model.objects.filter(
+                **{f'{field.field.name}__in': pks}
+            ).values_list('pk', flat=True)
+        querysets.append(queryset.order_by())
+    if not querysets:
+        return set()
+    return set(querysets[0].union(*querysets[1:]))
+
+
+def nesting_base_ids(model, pks):
+    """
+    The objects that render the relations of a nested object which point to, or
+    start from, the given objects: the keyword sets and keywords listing a
+    keyword whose narrower or broader concepts include one of them.
+    """
+    base_ids = set()
+    for owner, fields in nested_relations().items():
+        condition = Q(pk__in=pks) if owner is model else Q()
+        for field in fields:
+            if field.related_model is model:
+                condition |= Q(**{f'{field.name}__in': pks})
+        if condition:
+            owners = owner.objects.filter(condition).values('pk')
+            base_ids |= related_base_ids(owner, owners)
+    return base_ids
+
+
+def invalidate_representations(model, pks):
+    """
+    Drop the cached representations of the objects, of their related objects
+    and of the objects nesting their relations. The related objects are read
+    now, before e.g. a delete removes the relation rows, and the
+    representations are dropped after the commit.
+    """
+    pks = list(pks)
+    base_ids = set(pks)
+    for start in range(0, len(pks), settings.BULK_BATCH_SIZE):
+        batch = pks[start : start + settings.BULK_BATCH_SIZE]
+        base_ids |= related_base_ids(model, batch)
+        base_ids |= nesting_base_ids(model, batch)
+    expire_representations(base_ids)
+
+
+def in_atomic_block(using):
+    return connections[using].in_atomic_block
+
+
+def prefetch_group(objects, lookups):
+    """Prefetch in a worker thread, which opens a connection of its own."""
+    try:
+        prefetch_related_objects(objects, *lookups)
+    finally:
+        connections.close_all()
+
+
+def from_primary(objects):
+    """The objects as they are on the primary, reloaded if read from a replica."""
+    replica_pks = [obj.pk for obj in objects if obj._state.db != DEFAULT_DB_ALIAS]
+    if not replica_pks:
+        return objects
+    reloaded = (
+        type(objects[0])._default_manager.using(DEFAULT_DB_ALIAS).in_bulk(replica_pks)
+    )
+    return [reloaded.get(obj.pk, obj) for obj in objects]
+
+
+class CachedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that takes the representation of each object from the cache.
+
+    Entries are keyed by the serializer, the selected fields, nested_max_count,
+    the scheme and host of the request (file fields render as absolute URLs),
+    the base_id, its version token and last_modified_time. Versions read before
+    can be passed in the `representation_versions` context. Misses are read
+    from the primary. The prefetch plan of
+    the serializer is only run for the objects that were not cached, so the
+    querysets handed to it need no select_related/prefetch_related.
+    """
+
+    def variant(self):
+        """The parts of the request that change the representation of an object."""
+        request = self.context.get('request')
+        nested_max_count = query_param_validator(
+            request=request, param='nested_max_count'
+        )
+        state = (
+            type(self.child).__qualname__,
+            tuple(self.child.fields),
+            nested_max_count,
+            request.scheme if request else None,
+            request.get_host() if request else None,
+        )
+        return md5(repr(state).encode()).hexdigest()
+
+    def prefetch_lookups(self):
+        """The prefetch plan of the child serializer, as prefetch_related lookups."""
+        select_related, prefetch_related = build_prefetch_plan(
+            type(self.child)
+        ).lookups(
+            field_names=set(self.child.fields),
+            nested_max_count=query_param_validator(
+                request=self.context.get('request'), param='nested_max_count'
+            ),
+        )
+        return [*select_related, *prefetch_related]
+
+    def prefetch(self, objects):
+        """Run the prefetch plan of the child serializer for the given objects."""
+        prefetch_related_objects(objects, *self.prefetch_lookups())
+
+    def cache_keys(self, objects):
+        variant = self.variant()
+        # The view may have read the versions already, for the validators.
+        versions = self.context.get('representation_versions')
+        if versions is None or not versions.keys() >= {obj.pk for obj in objects}:
+            versions = representation_versions({obj.pk for obj in objects})
+        return [
+            f'{CACHE_PREFIX}:{variant}:{obj.pk}:{versions[obj.pk]}:'
+            f'{obj.last_modified_time.timestamp() if obj.last_modified_time else ""}'
+            for obj in objects
+        ]
+
+    def to_representation(self, data):
+        objects = list(data.all() if hasattr(data, 'all') else data)
+        if not objects:
+            return []
+
+        keys = self.cache_keys(objects)
+        cached = cache.get_many(keys)
+
+        missing = {key: obj for obj, key in zip(objects, keys) if key not in cached}
+        if missing:
+            # A lagging replica would put old data under the current versions.
+            with primary_reads():
+                misses = from_primary(list(missing.values()))
+                self.prefetch(misses)
+                cached.update(self.compute(dict(zip(missing, misses))))
+        return [cached[key] for key in keys]
+
+    async def ato_representation(self, objects):
+        """
+        to_representation() for async views. The relations of the objects that
+        are not cached are prefetched concurrently, see aprefetch().
+        """
+        if not objects:
+            return []
+
+        keys = await sync_to_async(self.cache_keys)(objects)
+        cached = await sync_to_async(cache.get_many)(keys)
+
+        missing = {key: obj for obj, key in zip(objects, keys) if key not in cached}
+        if missing:
+            with primary_reads():
+                misses = await sync_to_async(from_primary)(list(missing.values()))
+                await self.aprefetch(misses)
+                # The relations fetched above are not fetched again.
+                computed = await sync_to_async(self.compute)(dict(zip(missing, misses)))
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def compute(self, objects):
+        """Render and cache the representations of {cache key: object}."""
+        computed = {
+            key: self.child.to_representation(obj) for key, obj in objects.items()
+        }
+        cache.set_many(computed, timeout=settings.REPRESENTATION_CACHE_TIMEOUT)
+        return computed
+
+    async def aprefetch(self, objects):
+        """
+        Run the prefetch plan with the lookups grouped by the relation they start
+        with, and the groups at the same time in worker threads, each on its own
+        connection. Inside a transaction the plan runs on the request's
+        connection, the others would not see the transaction's writes.
+        """
+        groups = {}
+        for lookup in self.prefetch_lookups():
+            path = getattr(lookup, 'prefetch_to', lookup)
+            groups.setdefault(path.split(LOOKUP_SEP)[0], []).append(lookup)
+        using = router.db_for_read(type(objects[0]))
+        if len(groups) < 2 or await sync_to_async(in_atomic_block)(using):
+            await sync_to_async(self.prefetch)(objects)
+            return
+
+        # The groups fill these caches of the same objects, create them first.
+        for obj in objects:
+            obj._state.fields_cache
+            if not hasattr(obj, '_prefetched_objects_cache'):
+                obj._prefetched_objects_cache = {}
+        await asyncio.gather(
+            *(
+                sync_to_async(prefetch_group, thread_sensitive=False)(objects, lookups)
+                for lookups in groups.values()
+            )
+        )
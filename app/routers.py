@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import psycopg
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Database the reads of the current request go to, set by ReplicaRoutingMiddleware.
+# Everything outside of a routed request (commands, signals) reads the primary.
+read_database = ContextVar('read_database', default=DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, e.g. to fill a cache: data read from
+    a lagging replica would be stored under a version token that is newer than
+    it. Also works as a decorator.
+    """
+    token = read_database.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+# Seconds since the last replayed transaction, or 0 if the replica has replayed
+# everything it received. pg_last_xact_replay_timestamp() alone would report an
+# idle primary as lag.
+LAG_SQL = '''
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def replica_lag(alias):
+    """
+    Lag of a replica in seconds, None if it cannot be reached. Measured on a
+    separate short lived connection so that a dead replica fails fast instead of
+    waiting for a pool checkout.
+    """
+    params = connections[alias].get_connection_params()
+    try:
+        with psycopg.connect(
+            **params, connect_timeout=settings.REPLICA_CONNECT_TIMEOUT
+        ) as connection:
+            lag = connection.execute(LAG_SQL).fetchone()[0]
+    except psycopg.Error:
+        return None
+    return float(lag or 0)
+
+
+class ReplicaMonitor:
+    """
+    The replicas whose lag is below REPLICA_MAX_LAG, measured at most every
+    REPLICA_LAG_CHECK_INTERVAL seconds per process.
+
+    The lags are measured in a background thread and requests get the result
+    of the last measurement, so a replica that does not answer holds up no
+    request. Until the first measurement is done all reads go to the primary.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.checking = False
+        self.healthy = []
+        self.lags = {}
+
+    def healthy_replicas(self):
+        with self.lock:
+            now = time.monotonic()
+            due = (
+                self.checked is None
+                or now - self.checked >= settings.REPLICA_LAG_CHECK_INTERVAL
+            )
+            if due and not self.checking:
+                self.checking = True
+                threading.Thread(target=self.check, daemon=True).start()
+            return self.healthy
+
+    def check(self):
+        try:
+            lags = {alias: replica_lag(alias) for alias in replica_aliases()}
+        finally:
+            with self.lock:
+                self.checking = False
+                self.checked = time.monotonic()
+        with self.lock:
+            self.lags = lags
+            self.healthy = [
+                alias
+                for alias, lag in lags.items()
+                if lag is not None and lag <= settings.REPLICA_MAX_LAG
+            ]
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary, reads to the database chosen for the request.
+
+    All databases hold the same data, so relations between objects loaded from
+    different ones are allowed. Migrations only run on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Send the reads of safe-method requests to a healthy replica, picked once per
+    request so that all its queries see the same snapshot.
+
+    A client that writes gets a cookie that pins its requests to the primary
+    for PRIMARY_PIN_SECONDS, so it reads its own writes while the replicas
+    catch up. Code that must not read stale data, e.g. the change feeds and
+    the cache fills, uses primary_reads().
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    pin_cookie = 'primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_database.set(self.database_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = read_database.set(self.database_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_database.reset(token)
+        return self.process_response(request, response)
+
+    def database_for(self, request):
+        """The database the reads of the request go to."""
+        if (
+            request.method not in self.safe_methods
+            or self.pin_cookie in request.COOKIES
+            or not replica_aliases()
+        ):
+            return DEFAULT_DB_ALIAS
+        replicas = replica_monitor.healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def process_response(self, request, response):
+        if request.method not in self.safe_methods:
+            response.set_cookie(
+                self.pin_cookie,
+                '1',
+                max_age=settings.PRIMARY_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
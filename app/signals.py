@@ -1,6 +1,33 @@
-from django.dispatch import receiver
-from django.db.models.signals import pre_save
-from .utils import generate_base_id, multi_receiver
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.dispatch import Signal, receiver
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from .closure import CLOSURE_TABLES
+from .conditional import touch_m2m_change, touch_relations
+from .events import CREATED, DELETED, UPDATED, event, publish
+from .metrics import install_query_recorder
+from .slow_queries import install_slow_query_recorder
+from .impact import (
+    IMPACT_MODELS,
+    affected_servers,
+    impact_field_names,
+    impact_through_models,
+    invalidate_server_impact,
+)
+from .representations import (
+    expire_representations,
+    invalidate_representations,
+    nesting_base_ids,
+)
+from .utils import assign_base_id, multi_receiver
 from .models import (
     Customership,
     License,
@@ -14,39 +41,217 @@ from .models import (
     Keyword,
     KeywordSet,
     KeywordLabel,
+    Tombstone,
 )
 
+BASE_MODELS = [
+    Customership,
+    License,
+    Contract,
+    Application,
+    Service,
+    Server,
+    Directory,
+    Integration,
+    Provider,
+    Keyword,
+    KeywordSet,
+    KeywordLabel,
+]
+BASE_THROUGH_MODELS = {
+    field.remote_field.through
+    for model in BASE_MODELS
+    for field in model._meta.local_many_to_many
+}
 
-@multi_receiver(
-    pre_save,
-    senders=[
-        Customership,
-        License,
-        Contract,
-        Application,
-        Service,
-        Server,
-        Directory,
-        Integration,
-        Provider,
-        Keyword,
-        KeywordSet,
-        KeywordLabel,
-    ],
-)
+# Sent by BulkListSerializer after bulk writes, which skip post_save and m2m_changed,
+# and by bulk_delete before the rows are deleted. Arguments: sender (the model),
+# instances, relations ({field name: {pk: values}}), created and deleted.
+bulk_changed = Signal()
+
+# The pks of the objects bulk_delete is deleting. bulk_changed has covered them,
+# so their per-object delete receivers are skipped.
+bulk_deleted_pks = ContextVar('bulk_deleted_pks', default=frozenset())
+
+
+def deleted_in_bulk(instance):
+    return instance.pk in bulk_deleted_pks.get()
+
+
+@multi_receiver(pre_save, senders=BASE_MODELS)
 def on_pre_save(sender, instance, **kwargs):
     """Signal that fills and validates core id values for the instance before saving."""
-    try:
-        obj = sender.objects.get(pk=instance.pk)
-    except sender.DoesNotExist:
+    if instance._state.adding:
         # Set the specific id related values when the object gets first made.
-        token = generate_base_id(sender)
-        instance.base_id = f"{sender.model_prefix}-{token}"
-        instance.base_token = token
-        instance.id_prefix = instance.model_prefix
-        pass
+        assign_base_id(instance)
+    elif instance.base_id != f"{instance.id_prefix}-{instance.base_token}":
+        # Saving a changed primary key would write a second row.
+        raise ValidationError('The base_id of an object cannot be changed.')
+
+
+@receiver(connection_created)
+def on_connection_created_record_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
+    install_slow_query_recorder(connection)
+
+
+@multi_receiver(
+    m2m_changed,
+    senders={
+        through for closure in CLOSURE_TABLES for through in closure.through_models()
+    },
+)
+def on_closure_graph_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the closure tables in step with the relations they are built from."""
+    for closure in CLOSURE_TABLES:
+        if sender in closure.through_models():
+            closure.handle_m2m_changed(sender, instance, action, reverse, pk_set)
+
+
+@multi_receiver(
+    post_delete,
+    senders={model for closure in CLOSURE_TABLES for model in closure.node_models()},
+)
+def on_closure_node_deleted(sender, instance, **kwargs):
+    """
+    Deleting an object drops its through rows without m2m_changed. bulk_delete
+    merges these into one update with defer_closure_removals.
+    """
+    for closure in CLOSURE_TABLES:
+        if sender in closure.node_models():
+            closure.remove_nodes([instance.pk])
+
+
+@multi_receiver(post_save, senders=IMPACT_MODELS)
+def on_impact_saved(sender, instance, **kwargs):
+    """Invalidate the cached impact reports that show the object."""
+    invalidate_server_impact(affected_servers(sender, [instance.pk]))
+
+
+@multi_receiver(pre_delete, senders=IMPACT_MODELS)
+def on_impact_deleted(sender, instance, **kwargs):
+    """Before the delete, while the relations to the servers can still be read."""
+    if not deleted_in_bulk(instance):
+        invalidate_server_impact(affected_servers(sender, [instance.pk]))
+
+
+@multi_receiver(bulk_changed, senders=IMPACT_MODELS)
+def on_impact_bulk_changed(sender, instances, relations, created, **kwargs):
+    changed_fields = {field_name for values in relations for field_name in values}
+    if not created and changed_fields & impact_field_names(sender):
+        # Replaced relations are gone, the servers that lost one are not known.
+        invalidate_server_impact()
     else:
-        # TODO: Validate that the base_id has not changed on update.
-        if not obj.base_id == instance.base_id:
-            # Not done.
-            print("Base_id for some reason has changed, prevent!")
+        invalidate_server_impact(
+            affected_servers(sender, [instance.pk for instance in instances])
+        )
+
+
+@multi_receiver(m2m_changed, senders=impact_through_models())
+def on_impact_relations_changed(sender, instance, action, model, pk_set, **kwargs):
+    """Added and removed rows are seen from both sides, clear() before it runs."""
+    if action in ('post_add', 'post_remove'):
+        invalidate_server_impact(
+            affected_servers(type(instance), [instance.pk])
+            | affected_servers(model, pk_set)
+        )
+    elif action == 'pre_clear':
+        invalidate_server_impact(affected_servers(type(instance), [instance.pk]))
+
+
+@multi_receiver(m2m_changed, senders=BASE_THROUGH_MODELS)
+def on_m2m_changed_touch(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Relation changes save neither side, bump both for the conditional GET
+    validators that are computed from last_modified_time.
+    """
+    touch_m2m_change(sender, instance, action, reverse, model, pk_set)
+
+
+@multi_receiver(pre_delete, senders=BASE_MODELS)
+def on_pre_delete_touch(sender, instance, **kwargs):
+    """The relation rows of a deleted object go away without signals."""
+    if not deleted_in_bulk(instance):
+        touch_relations(sender, [instance.pk])
+
+
+@multi_receiver(post_save, senders=BASE_MODELS)
+def on_saved_invalidate_representations(sender, instance, **kwargs):
+    invalidate_representations(sender, [instance.pk])
+
+
+@multi_receiver(bulk_changed, senders=BASE_MODELS)
+def on_bulk_changed_invalidate_representations(sender, instances, **kwargs):
+    invalidate_representations(sender, [instance.pk for instance in instances])
+
+
+@multi_receiver(pre_delete, senders=BASE_MODELS)
+def on_pre_delete_invalidate_representations(sender, instance, **kwargs):
+    """Read the related objects while the relation rows still exist."""
+    if not deleted_in_bulk(instance):
+        invalidate_representations(sender, [instance.pk])
+
+
+@multi_receiver(m2m_changed, senders=BASE_THROUGH_MODELS)
+def on_m2m_changed_expire_representations(
+    sender, instance, action, model, pk_set, **kwargs
+):
+    if action.startswith('post_'):
+        pk_set = pk_set or set()
+        expire_representations(
+            {instance.pk, *pk_set}
+            | nesting_base_ids(type(instance), [instance.pk])
+            | nesting_base_ids(model, pk_set)
+        )
+
+
+@multi_receiver(post_delete, senders=BASE_MODELS)
+def on_deleted_add_tombstone(sender, instance, **kwargs):
+    """Record the deletion for the change feed."""
+    if not deleted_in_bulk(instance):
+        Tombstone.objects.create(base_id=instance.pk, id_prefix=instance.id_prefix)
+
+
+@multi_receiver(bulk_changed, senders=BASE_MODELS)
+def on_bulk_changed_touch(sender, instances, deleted=False, **kwargs):
+    if deleted:
+        touch_relations(sender, [instance.pk for instance in instances])
+
+
+@multi_receiver(bulk_changed, senders=BASE_MODELS)
+def on_bulk_changed_add_tombstones(sender, instances, deleted=False, **kwargs):
+    if deleted:
+        Tombstone.objects.bulk_create(
+            Tombstone(base_id=instance.pk, id_prefix=instance.id_prefix)
+            for instance in instances
+        )
+
+
+@multi_receiver(post_save, senders=BASE_MODELS)
+def on_saved_publish(sender, instance, created, **kwargs):
+    publish(sender, [event(CREATED if created else UPDATED, sender, instance.pk)])
+
+
+@multi_receiver(bulk_changed, senders=BASE_MODELS)
+def on_bulk_changed_publish(sender, instances, created, deleted=False, **kwargs):
+    action = DELETED if deleted else CREATED if created else UPDATED
+    publish(sender, [event(action, sender, instance.pk) for instance in instances])
+
+
+@multi_receiver(post_delete, senders=BASE_MODELS)
+def on_deleted_publish(sender, instance, **kwargs):
+    if deleted_in_bulk(instance):
+        return
+    publish(sender, [event(DELETED, sender, instance.pk)])
+
+
+@multi_receiver(m2m_changed, senders=BASE_THROUGH_MODELS)
+def on_m2m_changed_publish(sender, instance, action, model, pk_set, **kwargs):
+    """A relation change updates the objects on both sides."""
+    if not action.startswith('post_'):
+        return
+    publish(
+        type(instance),
+        [event(UPDATED, type(instance), instance.pk)]
+        + [event(UPDATED, model, pk) for pk in pk_set or ()],
+    )
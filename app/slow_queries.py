@@ -0,0 +1,212 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from . import metrics
+from .metrics import request_stats
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'slow_queries'
+# Frames outside the project, e.g. Django and DRF, and of the query recorders
+# are left out of the stack.
+PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+RECORDER_FILES = {__file__, metrics.__file__}
+STACK_DEPTH = 8
+# Statements that are run again for their plan. Writes are rolled back, but
+# would hold their row locks meanwhile.
+EXPLAINABLE = ('SELECT',)
+# Slow queries waiting for their plan. When full, queries are stored without one.
+EXPLAIN_QUEUE_SIZE = 20
+
+# Set while the recorder runs EXPLAIN, which is slow as well.
+explaining = ContextVar('explaining', default=False)
+
+
+def stack_summary():
+    """The innermost project frames leading to the query, as 'file:line in function'."""
+    frames = [
+        frame
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(PROJECT_DIR)
+        and frame.filename not in RECORDER_FILES
+        and 'site-packages' not in frame.filename
+    ]
+    return [
+        f'{Path(frame.filename).relative_to(PROJECT_DIR)}:{frame.lineno} in {frame.name}'
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+def originating_view(stats):
+    match = getattr(stats.request, 'resolver_match', None) if stats else None
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+def explain(alias, sql, params):
+    """
+    The EXPLAIN (ANALYZE, BUFFERS) plan of a query as JSON, or None.
+
+    ANALYZE runs the query again. It runs in a transaction that is always
+    rolled back, so that the side effects of functions it calls, such as
+    pg_notify() or set_config(), do not happen a second time.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return None
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    token = explaining.set(True)
+    try:
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            # Undo what the query did. Only set now, no query runs after it.
+            transaction.set_rollback(True, using=alias)
+    except DatabaseError:
+        logger.exception('EXPLAIN of a slow query failed')
+        return None
+    finally:
+        explaining.reset(token)
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+class Explainer:
+    """
+    Explains the sampled slow queries in a background thread with its own
+    connections, so that no request waits for a plan, and stores them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self.thread = None
+
+    def submit(self, alias, sql, params, entry):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((alias, sql, params, entry))
+        except queue.Full:
+            store(entry)
+
+    def run(self):
+        while True:
+            alias, sql, params, entry = self.queue.get()
+            try:
+                entry['plan'] = explain(alias, sql, params)
+                store(entry)
+            except Exception:
+                logger.exception('Recording a slow query failed')
+            finally:
+                # Return the connection between the rare slow queries.
+                connections[alias].close()
+
+
+explainer = Explainer()
+
+
+def ring_key(slot):
+    return f'{CACHE_PREFIX}:{slot}'
+
+
+def store(entry):
+    """
+    Put the entry into the ring buffer of SLOW_QUERY_BUFFER_SIZE slots in the
+    cache. The oldest entry is overwritten. The workers share the buffer only
+    if CACHE_URL names a shared cache, with the default local memory cache
+    each process has its own, which evicts it along with other entries.
+    """
+    counter = f'{CACHE_PREFIX}:next'
+    cache.add(counter, 0, timeout=None)
+    try:
+        position = cache.incr(counter)
+    except ValueError:
+        # Evicted between add() and incr().
+        cache.add(counter, 1, timeout=None)
+        position = 1
+    entry['id'] = position
+    cache.set(ring_key(position % settings.SLOW_QUERY_BUFFER_SIZE), entry, timeout=None)
+
+
+def recorded_slow_queries():
+    """The entries of the ring buffer, newest first."""
+    entries = cache.get_many(
+        [ring_key(slot) for slot in range(settings.SLOW_QUERY_BUFFER_SIZE)]
+    )
+    return sorted(entries.values(), key=lambda entry: entry['id'], reverse=True)
+
+
+def record_slow_query(connection, sql, params, many, duration, stats):
+    entry = {
+        'time': timezone.now().isoformat(),
+        'duration': duration,
+        'database': connection.alias,
+        'view': originating_view(stats),
+        'method': stats.request.method if stats else None,
+        'path': stats.request.get_full_path() if stats else None,
+        'sql': sql,
+        # executemany() is recorded with its statement only.
+        'params': None if many else [repr(param) for param in params or ()],
+        'stack': stack_summary(),
+        'plan': None,
+    }
+    logger.warning(
+        'Slow query (%.3f s) in %s: %s; params %s\n  %s',
+        duration,
+        entry['view'] or 'no view',
+        sql,
+        entry['params'],
+        '\n  '.join(entry['stack']),
+    )
+    if not many and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+        explainer.submit(connection.alias, sql, params, entry)
+    else:
+        store(entry)
+
+
+def slow_query_recorder(execute, sql, params, many, context):
+    """Execute wrapper that records queries slower than SLOW_QUERY_THRESHOLD."""
+    if explaining.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - start
+    if duration >= settings.SLOW_QUERY_THRESHOLD:
+        try:
+            record_slow_query(
+                context['connection'],
+                sql,
+                params,
+                many,
+                duration,
+                request_stats.get(),
+            )
+        except Exception:
+            # Recording must never fail the query it records.
+            logger.exception('Recording a slow query failed')
+    return result
+
+
+def install_slow_query_recorder(connection):
+    """Record the slow queries of a connection if SLOW_QUERY_THRESHOLD is set."""
+    if settings.SLOW_QUERY_THRESHOLD is None:
+        return
+    if slow_query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_recorder)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+
+import psycopg
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from psycopg import sql
+
+logger = logging.getLogger(__name__)
+
+# Scope key of the ASGI receive channel, see with_receive_channel().
+RECEIVE_SCOPE_KEY = 'app.receive'
+
+
+class Subscription:
+    """The queue of one client, with its resource type and base_id filters."""
+
+    def __init__(self, types, base_ids):
+        self.types = types
+        self.base_ids = base_ids
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        # Set when the client fell behind and events were dropped.
+        self.overflowed = False
+
+    def matches(self, event):
+        return (not self.types or event['type'] in self.types) and (
+            not self.base_ids or event['base_id'] in self.base_ids
+        )
+
+
+class EventBroker:
+    """
+    Fans the notifications of one LISTEN connection out to the subscribers.
+
+    There is one broker per process. The connection is opened with the first
+    subscriber, reopened after errors and closed with the last subscriber.
+    """
+
+    # Seconds to wait before reconnecting after the connection was lost.
+    reconnect_delay = 5
+
+    def __init__(self, channel, using='default'):
+        self.channel = channel
+        self.using = using
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self, types=(), base_ids=()):
+        subscription = Subscription(set(types), set(base_ids))
+        self.subscribers.add(subscription)
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+            self.task.add_done_callback(self.listener_done)
+        return subscription
+
+    def listener_done(self, task):
+        """Forget a listener that ended, the next subscriber starts a new one."""
+        if self.task is task:
+            self.task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Event listener stopped', exc_info=task.exception())
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def conninfo(self):
+        settings_dict = connections[self.using].settings_dict
+        return psycopg.conninfo.make_conninfo(
+            dbname=settings_dict['NAME'],
+            user=settings_dict['USER'],
+            password=settings_dict['PASSWORD'],
+            host=settings_dict['HOST'],
+            port=settings_dict['PORT'] or None,
+        )
+
+    async def listen(self):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    self.conninfo(), autocommit=True
+                ) as connection:
+                    await connection.execute(
+                        sql.SQL('LISTEN {}').format(sql.Identifier(self.channel))
+                    )
+                    async for notify in connection.notifies():
+                        self.dispatch(json.loads(notify.payload))
+            except psycopg.Error as error:
+                logger.warning('Event listener connection failed: %s', error)
+            except Exception:
+                logger.exception('Event listener failed')
+            await asyncio.sleep(self.reconnect_delay)
+
+    def dispatch(self, event):
+        for subscription in self.subscribers:
+            if subscription.overflowed or not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+
+broker = EventBroker(settings.EVENTS_CHANNEL)
+
+
+def query_list(request, param):
+    return [value for value in request.GET.get(param, '').split(',') if value]
+
+
+def with_receive_channel(application):
+    """
+    Wrap an ASGI application to put the receive channel into the scope of HTTP
+    requests. Django 4.2 keeps sending a streaming response after the client
+    went away, and the event stream reads http.disconnect from the channel
+    itself to end.
+    """
+
+    async def wrapper(scope, receive, send):
+        if scope['type'] == 'http':
+            scope = {**scope, RECEIVE_SCOPE_KEY: receive}
+        await application(scope, receive, send)
+
+    return wrapper
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def event_stream(subscription, receive=None):
+    """
+    Server-sent events of a subscription, with a comment line as keepalive.
+    Ends when `receive`, the ASGI receive channel, reports a disconnect.
+    """
+    disconnect = None
+    if receive is not None:
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        yield f'retry: {broker.reconnect_delay * 1000}\n\n'
+        while True:
+            if subscription.overflowed and subscription.queue.empty():
+                # Events were lost, the client has to catch up with the change feed.
+                yield 'event: overflow\ndata: {}\n\n'
+                return
+            get = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {get} if disconnect is None else {get, disconnect},
+                timeout=settings.EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if get in done:
+                event = get.result()
+                yield f"event: {event['action']}\ndata: {json.dumps(event)}\n\n"
+                continue
+            get.cancel()
+            if disconnect in done:
+                return
+            yield ': keepalive\n\n'
+    finally:
+        if disconnect is not None:
+            disconnect.cancel()
+        broker.unsubscribe(subscription)
+
+
+async def events(request):
+    """
+    Stream create, update and delete events as server-sent events.
+
+    Needs an ASGI server. Events are sent from commit on; use the change feed
+    of an endpoint to catch up on anything before connecting.
+
+    Examples:
+    1) /api/events/
+    2) /api/events/?type=application,server
+    3) /api/events/?base_id=app-...,srv-...
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Event streams need an ASGI server.', status=501)
+
+    subscription = broker.subscribe(
+        types=query_list(request, 'type'), base_ids=query_list(request, 'base_id')
+    )
+    response = StreamingHttpResponse(
+        event_stream(subscription, request.scope.get(RECEIVE_SCOPE_KEY)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1377 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import runpy
+import tempfile
+import time
+import uuid
+from contextlib import redirect_stdout
+from unittest import mock, skipIf
 
-# Create your tests here.
+import psycopg
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import (
+    AsyncClient,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import resolve
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from .backends.postgresql_pool.base import close_pools, pool_stats, pools
+from .changes import after
+from .closure import dependency_closure, keyword_closure
+from .events import CREATED, DELETED, UPDATED, event
+from .exceptions import TokenGenerationException
+from .management.commands.import_demo import Importer, JsonObjectStream
+from .metrics import UNMATCHED_ROUTE
+from .middleware import brotli
+from .models import (
+    Application,
+    Contract,
+    Customership,
+    DependencyClosure,
+    Keyword,
+    KeywordClosure,
+    KeywordSet,
+    License,
+    Server,
+    Service,
+    Tombstone,
+)
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .representations import prefetch_group, version_key
+from .routers import (
+    ReplicaMonitor,
+    ReplicaRoutingMiddleware,
+    primary_reads,
+    read_database,
+)
+from .slow_queries import Explainer, explain, recorded_slow_queries
+from .stream import broker, event_stream
+from .views import ApplicationViewSet
+
+
+def create_keyword(name):
+    return Keyword.objects.create(
+        name=name,
+        keyword_fi=name,
+        keyword_en=name,
+        keyword_sv=name,
+        keyword_se=name,
+    )
+
+
+def keyword_data(name):
+    return {
+        'name': name,
+        'keyword_fi': name,
+        'keyword_en': name,
+        'keyword_sv': name,
+        'keyword_se': name,
+    }
+
+
+def create_application(name, **fields):
+    return Application.objects.create(
+        name=name, person_register=False, personal_info_logging=False, **fields
+    )
+
+
+class FieldsFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_application('payroll', product_owner='alice')
+        create_application('payroll archive', product_owner='bob')
+        create_application('mail server', product_owner='alice')
+
+    def get_names(self, params):
+        response = self.client.get('/api/application/', params)
+        self.assertEqual(response.status_code, 200)
+        return [application['name'] for application in response.json()['results']]
+
+    def test_similar_values_match_best_first(self):
+        self.assertEqual(
+            self.get_names({'name': 'payrol'}), ['payroll', 'payroll archive']
+        )
+
+    def test_parameters_are_combined(self):
+        self.assertEqual(self.get_names({'name': 'payroll', 'product_owner': 'x'}), [])
+
+    def test_non_text_field(self):
+        response = self.client.get('/api/application/', {'person_register': 'true'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/application/', {'nope': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        keywords = [create_keyword(f'k{i}') for i in range(7)]
+        tied = timezone.now()
+        times = [None, None, tied, tied, tied, tied - datetime.timedelta(days=1), None]
+        for keyword, time in zip(keywords, times):
+            Keyword.objects.filter(pk=keyword.pk).update(last_modified_time=time)
+        # NULLs first, then newest first, ties broken by base_id.
+        self.expected = sorted(
+            (keyword.pk for keyword, time in zip(keywords, times) if time is None),
+            reverse=True,
+        ) + [
+            keyword.pk
+            for keyword, time in sorted(
+                (item for item in zip(keywords, times) if item[1] is not None),
+                key=lambda item: (item[1], item[0].pk),
+                reverse=True,
+            )
+        ]
+
+    def test_pages_cover_null_and_tied_timestamps(self):
+        seen = []
+        url = '/api/keyword/?cursor=&count=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json()['results']), 2)
+            seen += [keyword['base_id'] for keyword in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/keyword/?cursor=bm9wZQ')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_bounds_the_index_scan(self):
+        paginator = KeysetPagination()
+        cursor = paginator.encode_cursor(Keyword.objects.get(pk=self.expected[3]))
+        request = Request(RequestFactory().get('/', {'cursor': cursor}))
+        queryset = Keyword.objects.order_by(*paginator.ordering).filter(
+            paginator.position_filter(*paginator.decode_cursor(request))
+        )
+        with connection.cursor() as db_cursor:
+            # The table is too small for the planner to pick the index on its own.
+            db_cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn('keyword_modified_idx', plan)
+        self.assertIn('Index Cond: (ROW(last_modified_time', plan)
+
+
+class QueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.servers = [
+            Server.objects.create(name=f's{i}', install_date=datetime.date(2024, 1, 1))
+            for i in range(3)
+        ]
+        self.customerships = [
+            Customership.objects.create(name=f'c{i}') for i in range(2)
+        ]
+        self.keywords = [create_keyword(f'k{i}') for i in range(3)]
+        self.keywords[0].narrower.add(self.keywords[1], self.keywords[2])
+
+    def add_applications(self, count):
+        for i in range(count):
+            application = create_application(f'a{i}')
+            application.installed_server.add(*self.servers)
+            application.customership.add(*self.customerships)
+            application.keywords.add(*self.keywords)
+
+    def count_queries(self, url):
+        """Queries of a request, with nothing cached."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueryCountIsConstant(self, *urls):
+        self.add_applications(2)
+        few = [self.count_queries(url) for url in urls]
+        self.add_applications(8)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_list_query_count(self):
+        self.assertQueryCountIsConstant(
+            '/api/application/',
+            '/api/server/',
+            '/api/customership/',
+            '/api/keyword/',
+        )
+
+    def test_detail_query_count(self):
+        application = create_application('a')
+        application.installed_server.add(self.servers[0])
+        url = f'/api/application/{application.pk}/'
+        few = self.count_queries(url)
+        application.installed_server.add(*self.servers)
+        application.customership.add(*self.customerships)
+        application.keywords.add(*self.keywords)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_sparse_fields_skip_relations(self):
+        self.add_applications(2)
+        url = '/api/application/?fields=base_id,name'
+        self.assertLess(
+            self.count_queries(url), self.count_queries('/api/application/')
+        )
+        result = self.client.get(url).json()['results'][0]
+        self.assertEqual(set(result), {'base_id', 'name'})
+
+    def test_expand(self):
+        self.add_applications(1)
+        response = self.client.get(
+            '/api/application/', {'fields': 'base_id', 'expand': 'installed_server'}
+        )
+        result = response.json()['results'][0]
+        self.assertEqual(set(result), {'base_id', 'installed_server'})
+        self.assertEqual(
+            sorted(server['name'] for server in result['installed_server']),
+            ['s0', 's1', 's2'],
+        )
+        self.assertQueryCountIsConstant('/api/application/?expand=installed_server')
+
+    def test_unknown_names(self):
+        for params in ({'fields': 'nope'}, {'expand': 'keywords'}):
+            response = self.client.get('/api/application/', params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_nested_max_count_limits_each_parent(self):
+        self.add_applications(3)
+        response = self.client.get(
+            '/api/application/', {'nested_max_count': 1, 'expand': 'installed_server'}
+        )
+        for application in response.json()['results']:
+            self.assertEqual(len(application['installed_server']), 1)
+        response = self.client.get(f'/api/keyword/{self.keywords[0].pk}/')
+        self.assertEqual(len(response.json()['narrower']), 2)
+        response = self.client.get('/api/keyword/', {'nested_max_count': 1})
+        for keyword in response.json()['results']:
+            self.assertLessEqual(len(keyword['narrower']), 1)
+
+    def test_nested_max_count_query_count(self):
+        self.assertQueryCountIsConstant(
+            '/api/application/?nested_max_count=1&expand=installed_server',
+            '/api/keyword/?nested_max_count=1',
+        )
+
+
+class BaseIdTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_collision_is_retried(self):
+        with mock.patch('app.utils.generate_base_id', return_value='taken'):
+            first = create_keyword('a')
+        tokens = ['taken', 'taken', 'fresh']
+        with mock.patch('app.utils.generate_base_id', side_effect=tokens):
+            second = create_keyword('b')
+        self.assertEqual(first.pk, 'key-taken')
+        self.assertEqual(second.pk, 'key-fresh')
+        self.assertEqual(Keyword.objects.count(), 2)
+
+    def test_retries_run_out(self):
+        with mock.patch('app.utils.generate_base_id', return_value='taken'):
+            create_keyword('a')
+            with self.assertRaises(TokenGenerationException):
+                create_keyword('b')
+        self.assertEqual(Keyword.objects.count(), 1)
+
+    def test_explicit_base_id_updates(self):
+        keyword = create_keyword('a')
+        Keyword(
+            pk=keyword.pk,
+            name='b',
+            keyword_fi='b',
+            keyword_en='b',
+            keyword_sv='b',
+            keyword_se='b',
+        ).save()
+        self.assertEqual(
+            list(Keyword.objects.values_list('pk', 'name')), [(keyword.pk, 'b')]
+        )
+
+    def test_change_is_rejected_by_the_api(self):
+        keyword = create_keyword('a')
+        url = f'/api/keyword/{keyword.pk}/'
+        response = self.client.patch(url, {'base_id': 'key-other'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('base_id', response.json())
+        response = self.client.patch(
+            url, {'base_id': keyword.pk, 'name': 'b'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Keyword.objects.values_list('pk', 'name')), [(keyword.pk, 'b')]
+        )
+
+    def test_change_is_rejected_by_the_model(self):
+        keyword = create_keyword('a')
+        keyword.base_id = 'key-other'
+        with self.assertRaises(ValidationError):
+            keyword.save()
+        self.assertEqual(
+            list(Keyword.objects.values_list('pk', flat=True)),
+            ['key-' + keyword.base_token],
+        )
+
+
+class BulkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_create(self):
+        response = self.client.post(
+            '/api/keyword/', [keyword_data('a'), keyword_data('b')], format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([keyword['name'] for keyword in response.json()], ['a', 'b'])
+        self.assertEqual(Keyword.objects.count(), 2)
+
+    def test_create_is_all_or_nothing(self):
+        response = self.client.post(
+            '/api/keyword/', [keyword_data('a'), {'name': 'b'}], format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertFalse(Keyword.objects.exists())
+
+    def test_update(self):
+        a, b = create_keyword('a'), create_keyword('b')
+        response = self.client.patch(
+            '/api/keyword/bulk/',
+            [{'base_id': a.pk, 'narrower': [b.pk]}, {'base_id': b.pk, 'name': 'c'}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(a.narrower.all()), [b])
+        self.assertEqual(Keyword.objects.get(pk=b.pk).name, 'c')
+
+    def test_update_unknown_object(self):
+        a = create_keyword('a')
+        response = self.client.patch(
+            '/api/keyword/bulk/',
+            [{'base_id': a.pk, 'name': 'b'}, {'base_id': 'nope', 'name': 'c'}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Keyword.objects.get(pk=a.pk).name, 'a')
+
+    def test_delete(self):
+        a, b, c = create_keyword('a'), create_keyword('b'), create_keyword('c')
+        response = self.client.delete('/api/keyword/bulk/', [a.pk, b.pk], format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Keyword.objects.all()), [c])
+
+    def bulk_queries(self, size):
+        """Queries of creating, updating and deleting `size` keywords in bulk."""
+        counts = []
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/keyword/',
+                [keyword_data(f'k{i}') for i in range(size)],
+                format='json',
+            )
+        counts.append(len(context.captured_queries))
+        pks = [keyword['base_id'] for keyword in response.json()]
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch(
+                '/api/keyword/bulk/',
+                [{'base_id': pk, 'name': 'x'} for pk in pks],
+                format='json',
+            )
+        counts.append(len(context.captured_queries))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete('/api/keyword/bulk/', pks, format='json')
+        counts.append(len(context.captured_queries))
+        self.assertEqual(response.status_code, 204)
+        return counts
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.assertEqual(self.bulk_queries(2), self.bulk_queries(10))
+
+
+class ClosureTests(TestCase):
+    def assertClosureMatchesRebuild(self, table):
+        rows = set(table.model.objects.values_list('ancestor', 'descendant', 'depth'))
+        table.rebuild()
+        rebuilt = set(
+            table.model.objects.values_list('ancestor', 'descendant', 'depth')
+        )
+        self.assertEqual(rows, rebuilt)
+        return rows
+
+    def test_dependency_closure(self):
+        a, b = create_application('a'), create_application('b')
+        s, t = Service.objects.create(name='s'), Service.objects.create(name='t')
+        # a -> s -> b -> t, through relations declared on both models.
+        a.service_dependency.add(s)
+        s.required_installations.add(b)
+        b.service_dependency.add(t)
+        rows = self.assertClosureMatchesRebuild(dependency_closure)
+        self.assertIn((a.pk, t.pk, 3), rows)
+
+        # A shortcut keeps the shortest distance, a cycle ends the walk.
+        a.service_dependency.add(t)
+        t.required_installations.add(a)
+        rows = self.assertClosureMatchesRebuild(dependency_closure)
+        self.assertIn((a.pk, t.pk, 1), rows)
+        self.assertIn((t.pk, b.pk, 3), rows)
+
+        a.service_dependency.remove(t)
+        rows = self.assertClosureMatchesRebuild(dependency_closure)
+        self.assertIn((a.pk, t.pk, 3), rows)
+
+        s.delete()
+        rows = self.assertClosureMatchesRebuild(dependency_closure)
+        self.assertEqual(rows, {(b.pk, t.pk, 1), (b.pk, a.pk, 2), (t.pk, a.pk, 1)})
+
+    def test_oversized_refresh_rebuilds_after_commit(self):
+        a, b = create_application('a'), create_application('b')
+        s = Service.objects.create(name='s')
+        a.service_dependency.add(s)
+        s.required_installations.add(b)
+        reaches_b = DependencyClosure.objects.filter(ancestor=a.pk, descendant=b.pk)
+        with mock.patch.object(dependency_closure, 'MAX_REFRESH_SIZE', 1):
+            with mock.patch.object(dependency_closure, 'start_rebuild') as rebuild:
+                with self.captureOnCommitCallbacks(execute=True):
+                    s.required_installations.remove(b)
+                # The removal left the rows alone, the rebuild drops them.
+                self.assertTrue(reaches_b.exists())
+        rebuild.assert_called_once_with()
+        dependency_closure.rebuild()
+        self.assertFalse(reaches_b.exists())
+
+    def test_keyword_closure(self):
+        a, b, c, d = [create_keyword(name) for name in 'abcd']
+        # Both directions of the hierarchy are used.
+        a.narrower.add(b)
+        c.broader.add(b)
+        d.broader.add(c)
+        self.assertClosureMatchesRebuild(keyword_closure)
+        response = self.client.get(f'/api/keyword/{a.pk}/subtree/')
+        self.assertEqual(
+            [(keyword['name'], keyword['depth']) for keyword in response.json()],
+            [('b', 1), ('c', 2), ('d', 3)],
+        )
+
+        c.broader.remove(b)
+        self.assertClosureMatchesRebuild(keyword_closure)
+        response = self.client.get(f'/api/keyword/{d.pk}/ancestors/')
+        self.assertEqual(
+            [(keyword['name'], keyword['depth']) for keyword in response.json()],
+            [('c', 1)],
+        )
+
+        b.delete()
+        self.assertClosureMatchesRebuild(keyword_closure)
+        self.assertFalse(KeywordClosure.objects.filter(ancestor=a.pk).exists())
+
+    def test_keyword_closure_depth(self):
+        a, b, c = [create_keyword(name) for name in 'abc']
+        a.narrower.add(b)
+        b.narrower.add(c)
+        url = f'/api/keyword/{a.pk}/subtree/'
+        for depth, names in (('1', ['b']), ('0', []), ('', ['b', 'c'])):
+            with self.subTest(depth=depth):
+                response = self.client.get(url, {'depth': depth})
+                self.assertEqual(
+                    [keyword['name'] for keyword in response.json()], names
+                )
+
+
+class DependencyGraphTests(TestCase):
+    def setUp(self):
+        self.a, self.b = create_application('a'), create_application('b')
+        self.s = Service.objects.create(name='s')
+        self.t = Service.objects.create(name='t')
+        # a -> s -> b -> t, where -> points to what the object depends on.
+        self.a.service_dependency.add(self.s)
+        self.s.required_installations.add(self.b)
+        self.b.service_dependency.add(self.t)
+
+    def get_graph(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, nodes):
+        return [(node['name'], node['depth']) for node in nodes]
+
+    def test_upstream(self):
+        url = f'/api/application/{self.a.pk}/dependencies/'
+        graph = self.get_graph(url, direction='upstream')
+        self.assertEqual(graph['name'], 'a')
+        self.assertNotIn('downstream', graph)
+        self.assertEqual(self.names(graph['upstream']), [('s', 1), ('b', 2), ('t', 3)])
+
+    def test_downstream(self):
+        url = f'/api/service/{self.t.pk}/dependencies/'
+        graph = self.get_graph(url, direction='downstream')
+        self.assertNotIn('upstream', graph)
+        self.assertEqual(
+            self.names(graph['downstream']), [('b', 1), ('s', 2), ('a', 3)]
+        )
+
+    def test_both_directions(self):
+        graph = self.get_graph(f'/api/application/{self.b.pk}/dependencies/')
+        self.assertEqual(self.names(graph['upstream']), [('t', 1)])
+        self.assertEqual(self.names(graph['downstream']), [('s', 1), ('a', 2)])
+
+    def test_depth(self):
+        url = f'/api/application/{self.a.pk}/dependencies/'
+        graph = self.get_graph(url, depth=2)
+        self.assertEqual(graph['depth'], 2)
+        self.assertEqual(self.names(graph['upstream']), [('s', 1), ('b', 2)])
+        graph = self.get_graph(url, depth=0)
+        self.assertEqual((graph['depth'], graph['upstream']), (0, []))
+
+    def test_symmetrical_dependency(self):
+        c = create_application('c')
+        self.a.application_dependency.add(c)
+        graph = self.get_graph(f'/api/application/{c.pk}/dependencies/', depth=1)
+        self.assertEqual(self.names(graph['upstream']), [('a', 1)])
+        self.assertEqual(self.names(graph['downstream']), [('a', 1)])
+
+    def test_invalid_requests(self):
+        url = f'/api/application/{self.a.pk}/dependencies/'
+        self.assertEqual(self.client.get(url, {'direction': 'up'}).status_code, 400)
+        # The base_id of a service is not an application.
+        url = f'/api/application/{self.s.pk}/dependencies/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ServerImpactCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.server = Server.objects.create(
+            name='s', install_date=datetime.date(2024, 1, 1)
+        )
+        self.application = create_application('a')
+        self.application.installed_server.add(self.server)
+
+    def get_report(self):
+        response = self.client.get(f'/api/server/{self.server.pk}/impact/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def application_names(self):
+        return [
+            application['name'] for application in self.get_report()['applications']
+        ]
+
+    def test_cached(self):
+        self.get_report()
+        with self.assertNumQueries(0):
+            self.get_report()
+
+    def test_invalidated_by_rename(self):
+        self.assertEqual(self.application_names(), ['a'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.application.name = 'b'
+            self.application.save()
+        self.assertEqual(self.application_names(), ['b'])
+
+    def test_invalidated_by_relation_change(self):
+        self.assertEqual(self.application_names(), ['a'])
+        other = create_application('c')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.server.applications.add(other)
+        self.assertEqual(self.application_names(), ['a', 'c'])
+        customership = Customership.objects.create(name='customer')
+        with self.captureOnCommitCallbacks(execute=True):
+            other.customership.add(customership)
+        self.assertEqual(
+            [customer['name'] for customer in self.get_report()['customerships']],
+            ['customer'],
+        )
+
+    def test_unrelated_server_stays_cached(self):
+        other = Server.objects.create(name='t', install_date=datetime.date(2024, 1, 1))
+        self.client.get(f'/api/server/{other.pk}/impact/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.application.name = 'b'
+            self.application.save()
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/server/{other.pk}/impact/')
+
+
+IMPORT_DATA = {
+    'applications': {
+        'app_1': {
+            'name': 'a1',
+            'person_register': False,
+            'personal_info_logging': False,
+            'relation_fields': {
+                'license': 'lcn_1',
+                'installed_server': ['srv_1'],
+                'application_dependency': ['app_2'],
+            },
+        },
+        'app_2': {
+            'name': 'a2',
+            'person_register': True,
+            'personal_info_logging': False,
+            'relation_fields': {'license': None, 'installed_server': []},
+        },
+    },
+    'contracts': {
+        'con_1': {
+            'name': 'c1',
+            'invoices_per_year': 1,
+            'value_per_year': 100,
+            'valid_from_date': '2024-01-01',
+            'valid_until_date': '2025-01-01',
+        }
+    },
+    'customerships': {},
+    'directories': {},
+    'integrations': {},
+    'licenses': {
+        'lcn_1': {
+            'name': 'l1',
+            'valid_from_date': '2024-01-01',
+            'valid_until_date': '2025-01-01',
+            'relation_fields': {'contract': 'con_1'},
+        }
+    },
+    'providers': {},
+    'servers': {'srv_1': {'name': 's1', 'install_date': '2024-01-01'}},
+    'services': {
+        'ser_1': {
+            'name': 'v1',
+            'relation_fields': {'required_installations': ['app_1']},
+        }
+    },
+}
+
+
+class ImportDemoTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = directory.name
+        patcher = mock.patch.object(Importer, 'data_dir', self.data_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_data(self, data):
+        for json_keyword, objects in data.items():
+            path = os.path.join(self.data_dir, f'{json_keyword}.json')
+            with open(path, 'w') as json_file:
+                json.dump({json_keyword: objects}, json_file)
+
+    def run_import(self, *args):
+        with redirect_stdout(io.StringIO()):
+            call_command('import_demo', *args)
+
+    def assertImported(self):
+        a1 = Application.objects.get(name='a1')
+        a2 = Application.objects.get(name='a2')
+        service = Service.objects.get()
+        self.assertEqual(a1.license.name, 'l1')
+        self.assertEqual(License.objects.get().contract, Contract.objects.get())
+        self.assertEqual(list(a1.installed_server.all()), [Server.objects.get()])
+        self.assertIsNone(a2.license)
+        # Symmetrical, so stored in both directions.
+        self.assertEqual(list(a2.application_dependency.all()), [a1])
+        self.assertEqual(list(service.required_installations.all()), [a1])
+        self.assertEqual(
+            set(
+                DependencyClosure.objects.values_list('ancestor', 'descendant', 'depth')
+            ),
+            {
+                (service.pk, a1.pk, 1),
+                (service.pk, a2.pk, 2),
+                (a1.pk, a2.pk, 1),
+                (a2.pk, a1.pk, 1),
+            },
+        )
+
+    def test_import(self):
+        self.write_data(IMPORT_DATA)
+        self.run_import()
+        self.assertImported()
+
+    def test_stream_import(self):
+        self.write_data(IMPORT_DATA)
+        self.run_import('--stream', '--batch-size', '1')
+        self.assertImported()
+
+    def test_malformed_file(self):
+        self.write_data(IMPORT_DATA)
+        with open(os.path.join(self.data_dir, 'servers.json'), 'w') as json_file:
+            json_file.write('{"servers": {"srv_1": {"name": "ä",}}}')
+        for args in ((), ('--stream',)):
+            with self.subTest(args=args):
+                with self.assertRaisesMessage(CommandError, 'at byte 36'):
+                    self.run_import(*args)
+
+    def test_unknown_reference(self):
+        data = dict(
+            IMPORT_DATA,
+            services={
+                'ser_1': {
+                    'name': 'v1',
+                    'relation_fields': {'required_installations': ['app_9']},
+                }
+            },
+        )
+        self.write_data(data)
+        with self.assertRaisesMessage(CommandError, 'unknown object app_9'):
+            self.run_import('--stream')
+
+
+class JsonObjectStreamTests(TestCase):
+    def items(self, text, json_keyword='servers', chunk_size=3):
+        stream = JsonObjectStream(io.StringIO(text), chunk_size=chunk_size)
+        return list(stream.items(json_keyword))
+
+    def test_items(self):
+        text = '{"other": [1, {"x": 2}], "servers": {"a": {"name": "ääkkönen"}, "b": 12345}}'
+        expected = [('a', {'name': 'ääkkönen'}), ('b', 12345)]
+        for chunk_size in (1, 2, 3, 7, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.items(text, chunk_size=chunk_size), expected)
+
+    def test_empty_object(self):
+        self.assertEqual(self.items(' { "servers" : { } } '), [])
+
+    def test_error_byte_offset(self):
+        # The two-byte characters before the error count twice.
+        text = '{"servers": {"ää": {"name": "ö" "x"}}}'
+        with self.assertRaisesMessage(CommandError, 'Invalid JSON at byte 35'):
+            self.items(text)
+
+    def test_truncated_file(self):
+        with self.assertRaisesMessage(CommandError, "got ''"):
+            self.items('{"servers": {"a": 1')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.a = create_keyword('a')
+        self.keyword_set = KeywordSet.objects.create(name='set')
+        self.keyword_set.keywords.add(self.a)
+
+    def assertRevalidates(self, url, edit):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            edit()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def rename_nested_keyword(self):
+        self.a.name = 'b'
+        self.a.save()
+
+    def test_detail_after_nested_edit(self):
+        self.assertRevalidates(
+            f'/api/keywordset/{self.keyword_set.pk}/', self.rename_nested_keyword
+        )
+
+    def test_list_after_nested_edit(self):
+        self.assertRevalidates('/api/keywordset/', self.rename_nested_keyword)
+        self.assertRevalidates('/api/keywordset/?cursor=', self.rename_nested_keyword)
+
+    def test_detail_after_nested_relation_change(self):
+        b = create_keyword('b')
+        self.assertRevalidates(
+            f'/api/keywordset/{self.keyword_set.pk}/', lambda: self.a.narrower.add(b)
+        )
+
+
+class RendererTests(TestCase):
+    data = {
+        'time': datetime.datetime(
+            2024, 1, 2, 3, 4, 5, 6789, tzinfo=datetime.timezone.utc
+        ),
+        'date': datetime.date(2024, 1, 2),
+        'decimal': decimal.Decimal('1.50'),
+        'uuid': uuid.UUID(int=1),
+        'text': 'ääkkönen \u2028 \u2029 "quoted"',
+        'nested': [{1: None, 'list': [1, 2.5, True]}],
+    }
+
+    def test_output_matches_drf(self):
+        for media_type in ('application/json', 'application/json; indent=4'):
+            with self.subTest(media_type=media_type):
+                self.assertEqual(
+                    FastJSONRenderer().render(self.data, media_type),
+                    JSONRenderer().render(self.data, media_type),
+                )
+
+    def test_indented_output_decodes_the_same(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render(self.data, media_type)),
+            json.loads(JSONRenderer().render(self.data, media_type)),
+        )
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        for i in range(30):
+            create_keyword(f'keyword {i}')
+
+    def get(self, url, accept_encoding):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        response = self.get('/api/keyword/', 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        data = json.loads(brotli.decompress(response.content))
+        self.assertEqual(data, self.get('/api/keyword/', '').json())
+
+    def test_gzip(self):
+        for accept_encoding in ('gzip', 'gzip, br;q=0'):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get('/api/keyword/', accept_encoding)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(
+                    json.loads(gzip.decompress(response.content))['count'], 30
+                )
+
+    def test_uncompressed(self):
+        # Small responses and HTML pages are sent as is.
+        Keyword.objects.exclude(name='keyword 0').delete()
+        response = self.get('/api/keyword/', 'gzip, br')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.get('/api/keyword/?format=api', 'gzip, br')
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        for name in ('a', '=1+2', '@SUM(A1)', '-b', '+c'):
+            create_keyword(name)
+
+    def export(self, **params):
+        response = self.client.get('/api/keyword/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            rows[0], self.client.get(f'/api/keyword/{rows[0]["base_id"]}/').json()
+        )
+
+    def test_csv_formula_escaping(self):
+        rows = list(csv.reader(io.StringIO(self.export(output='csv', fields='name'))))
+        self.assertEqual(rows[0], ['name'])
+        self.assertCountEqual(
+            [row[0] for row in rows[1:]], ['a', "'=1+2", "'@SUM(A1)", "'-b", "'+c"]
+        )
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    async def test_asgi_streams_chunks(self):
+        response = await AsyncClient().get('/api/keyword/export/')
+        self.assertTrue(response.is_async)
+        parts = [part async for part in response.streaming_content]
+        # One part per chunk of two objects.
+        self.assertEqual([part.count(b'\n') for part in parts], [2, 2, 1])
+
+
+@override_settings(CHANGE_FEED_SAFETY_LAG=0)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.applications = [create_application(f'a{i}') for i in range(5)]
+
+    def sync(self, cursor=None):
+        """Follow the feed to its end, returns (modified, deleted, cursor)."""
+        modified, deleted = {}, set()
+        while True:
+            params = {'count': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/application/changes/', params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            for application in data['modified']:
+                modified[application['base_id']] = application['name']
+            deleted.update(tombstone['base_id'] for tombstone in data['deleted'])
+            cursor = data['cursor']
+            if not data['more']:
+                return modified, deleted, cursor
+
+    def test_changes_and_tombstones(self):
+        modified, deleted, cursor = self.sync()
+        self.assertEqual(
+            set(modified), {application.pk for application in self.applications}
+        )
+        self.assertEqual(deleted, set())
+
+        changed, removed = self.applications[0], self.applications[1]
+        changed.name = 'changed'
+        changed.save()
+        removed_pk = removed.pk
+        removed.delete()
+        new = create_application('new')
+        self.assertTrue(Tombstone.objects.filter(base_id=removed_pk).exists())
+
+        modified, deleted, cursor = self.sync(cursor)
+        self.assertEqual(modified, {changed.pk: 'changed', new.pk: 'new'})
+        self.assertEqual(deleted, {removed_pk})
+
+        self.assertEqual(self.sync(cursor)[:2], ({}, set()))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/application/changes/', {'cursor': 'bad'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_position_bounds_the_index_scan(self):
+        position = (timezone.now(), self.applications[0].pk)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plans = [
+            Application.objects.filter(after(position, 'last_modified_time')).order_by(
+                'last_modified_time', 'base_id'
+            ),
+            Tombstone.objects.filter(
+                after(position, 'deleted_time'), id_prefix='app'
+            ).order_by('deleted_time', 'base_id'),
+        ]
+        for queryset, index in zip(
+            plans, ('application_modified_idx', 'tombstone_feed_idx')
+        ):
+            with self.subTest(index=index):
+                plan = queryset.explain()
+                self.assertIn(index, plan)
+                self.assertRegex(plan, r'Index Cond: .*ROW\(')
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        # No LISTEN connection, the tests hand the events to the broker.
+        patcher = mock.patch.object(broker, 'listen', lambda: asyncio.sleep(3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_needs_asgi(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 501)
+
+    async def test_stream(self):
+        subscription = broker.subscribe(types=['application'])
+        stream = event_stream(subscription)
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        broker.dispatch(event(UPDATED, Server, 'srv-1'))
+        broker.dispatch(event(UPDATED, Application, 'app-1'))
+        self.assertEqual(
+            await anext(stream),
+            'event: updated\ndata: '
+            '{"action": "updated", "type": "application", "base_id": "app-1"}\n\n',
+        )
+        with self.settings(EVENTS_KEEPALIVE=0.01):
+            self.assertEqual(await anext(stream), ': keepalive\n\n')
+        await stream.aclose()
+        self.assertNotIn(subscription, broker.subscribers)
+        self.assertIsNone(broker.task)
+
+    @override_settings(EVENTS_QUEUE_SIZE=1)
+    async def test_overflow(self):
+        subscription = broker.subscribe(base_ids=['app-1', 'app-2'])
+        stream = event_stream(subscription)
+        await anext(stream)
+        broker.dispatch(event(UPDATED, Application, 'app-1'))
+        broker.dispatch(event(UPDATED, Application, 'app-2'))
+        self.assertIn('app-1', await anext(stream))
+        # The client has to catch up with the change feed.
+        self.assertEqual(await anext(stream), 'event: overflow\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertNotIn(subscription, broker.subscribers)
+
+    async def test_disconnect(self):
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        stream = event_stream(broker.subscribe(), receive)
+        await anext(stream)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+
+class EventPublishTests(TransactionTestCase):
+    def setUp(self):
+        self.listener = psycopg.connect(broker.conninfo(), autocommit=True)
+        self.addCleanup(self.listener.close)
+        self.listener.execute(f'LISTEN {settings.EVENTS_CHANNEL}')
+        self.events = []
+        self.listener.add_notify_handler(
+            lambda notify: self.events.append(json.loads(notify.payload))
+        )
+
+    def received(self):
+        # Notifications are read with the result of the next statement.
+        self.listener.execute('SELECT 1')
+        return [(e['action'], e['type'], e['base_id']) for e in self.events]
+
+    def test_committed_changes(self):
+        base_id = create_application('a').base_id
+        Application.objects.get(pk=base_id).delete()
+        self.assertEqual(
+            self.received(),
+            [
+                (CREATED, 'application', base_id),
+                (DELETED, 'application', base_id),
+            ],
+        )
+
+    def test_rolled_back_changes(self):
+        with transaction.atomic():
+            create_application('a')
+            transaction.set_rollback(True)
+        self.assertEqual(self.received(), [])
+
+
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.application = create_application('a')
+        self.application.installed_server.add(
+            Server.objects.create(name='s', install_date=datetime.date(2024, 1, 1))
+        )
+        self.application.customership.add(Customership.objects.create(name='c'))
+        self.application.keywords.add(create_keyword('k'))
+
+    def test_views_are_coroutine_functions(self):
+        for url in ('/api/application/', f'/api/application/{self.application.pk}/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_concurrent_prefetch(self):
+        # Outside of a transaction every relation is fetched in its own thread.
+        with mock.patch(
+            'app.representations.prefetch_group', wraps=prefetch_group
+        ) as group:
+            response = await AsyncClient().get('/api/application/')
+        self.assertGreater(group.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        await sync_to_async(cache.clear)()
+        expected = await sync_to_async(self.client.get)('/api/application/')
+        self.assertEqual(response.json(), expected.json())
+        [application] = response.json()['results']
+        self.assertEqual(application['installed_server'][0]['name'], 's')
+
+    async def test_detail(self):
+        client = AsyncClient()
+        url = f'/api/application/{self.application.pk}/'
+        response = await client.get(url)
+        self.assertEqual(response.json()['name'], 'a')
+        not_modified = await client.get(
+            url, headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual((await client.get('/api/application/app-x/')).status_code, 404)
+
+    async def test_keyset_page(self):
+        response = await AsyncClient().get('/api/keyword/', {'cursor': ''})
+        self.assertEqual(
+            [keyword['name'] for keyword in response.json()['results']], ['k']
+        )
+
+    async def test_initial_runs(self):
+        # Permissions are checked, and writes go to their sync handler.
+        with mock.patch.object(ApplicationViewSet, 'permission_classes', [IsAdminUser]):
+            response = await AsyncClient().get('/api/application/')
+        self.assertEqual(response.status_code, 403)
+        response = await AsyncClient().post(
+            '/api/keyword/', keyword_data('new'), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    def pool(self):
+        return pools[connection.pool_key_in_use]
+
+    def test_session_parameters(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW pg_trgm.similarity_threshold')
+            self.assertEqual(
+                cursor.fetchone()[0], str(settings.TRIGRAM_SIMILARITY_THRESHOLD)
+            )
+
+    def test_close_returns_the_connection(self):
+        connection.ensure_connection()
+        pool, raw = self.pool(), connection.connection
+        in_use = pool_stats()[connection.alias]['connections_in_use']
+        connection.close()
+        self.assertFalse(raw.closed)
+        self.assertEqual(
+            pool_stats()[connection.alias]['connections_in_use'], in_use - 1
+        )
+        connection.ensure_connection()
+        self.assertIs(self.pool(), pool)
+
+    def test_close_pools(self):
+        connection.ensure_connection()
+        pool, raw = self.pool(), connection.connection
+        connection.close()
+        close_pools(connection.settings_dict['NAME'])
+        self.assertTrue(raw.closed)
+        self.assertNotIn(pool, pools.values())
+        # The next connection opens a new pool.
+        connection.ensure_connection()
+        self.assertIsNot(self.pool(), pool)
+
+    def test_stats_need_admin(self):
+        self.assertEqual(self.client.get('/api/db-pool/').status_code, 403)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        for target, value in (
+            ('app.routers.replica_aliases', ['replica_1']),
+            ('app.routers.replica_monitor.healthy_replicas', ['replica_1']),
+        ):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.middleware = ReplicaRoutingMiddleware(
+            lambda request: HttpResponse(read_database.get())
+        )
+
+    def read_database(self, request):
+        return self.middleware(request).content.decode()
+
+    def test_safe_methods_read_from_a_replica(self):
+        factory = RequestFactory()
+        self.assertEqual(self.read_database(factory.get('/')), 'replica_1')
+        self.assertEqual(self.read_database(factory.post('/')), 'default')
+        with primary_reads():
+            self.assertEqual(read_database.get(), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        factory = RequestFactory()
+        response = self.middleware(factory.post('/'))
+        cookie = response.cookies[ReplicaRoutingMiddleware.pin_cookie]
+        self.assertEqual(cookie['max-age'], settings.PRIMARY_PIN_SECONDS)
+        request = factory.get('/')
+        request.COOKIES[cookie.key] = cookie.value
+        self.assertEqual(self.read_database(request), 'default')
+
+    @override_settings(REPLICA_MAX_LAG=5)
+    def test_lagging_replicas_are_dropped(self):
+        lags = {'replica_1': 0.5, 'replica_2': 60, 'replica_3': None}
+        monitor = ReplicaMonitor()
+        with mock.patch('app.routers.replica_aliases', return_value=list(lags)):
+            with mock.patch('app.routers.replica_lag', side_effect=lags.get):
+                # Reads go to the primary until the first measurement is done.
+                self.assertEqual(monitor.healthy_replicas(), [])
+                for _ in range(100):
+                    if monitor.lags:
+                        break
+                    time.sleep(0.01)
+        self.assertEqual(monitor.healthy_replicas(), ['replica_1'])
+        self.assertEqual(monitor.lags, lags)
+
+
+class RepresentationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.a = create_keyword('a')
+        self.b = create_keyword('b')
+        self.c = create_keyword('c')
+        self.a.narrower.add(self.b)
+        self.keyword_set = KeywordSet.objects.create(name='set')
+        self.keyword_set.keywords.add(self.a)
+
+    def get_narrower(self):
+        """The narrower concepts of the keywords in the set, as rendered."""
+        response = self.client.get(f'/api/keywordset/{self.keyword_set.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return [sorted(keyword['narrower']) for keyword in response.json()['keywords']]
+
+    def test_null_last_modified_time(self):
+        Keyword.objects.filter(pk=self.a.pk).update(last_modified_time=None)
+        self.assertEqual(self.client.get(f'/api/keyword/{self.a.pk}/').status_code, 200)
+        self.assertEqual(self.client.get('/api/keyword/').status_code, 200)
+
+    def test_hidden_reverse_relation(self):
+        self.client.get(f'/api/keyword/{self.a.pk}/')
+        self.assertIsNotNone(cache.get(version_key(self.a.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b.delete()
+        # a lists b as narrower through a relation without a reverse accessor.
+        self.assertIsNone(cache.get(version_key(self.a.pk)))
+
+    def test_second_degree_nesting(self):
+        self.assertEqual(self.get_narrower(), [[self.b.pk]])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.narrower.add(self.c)
+        self.assertEqual(self.get_narrower(), [sorted([self.b.pk, self.c.pk])])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b.delete()
+        self.assertEqual(self.get_narrower(), [[self.c.pk]])
+
+    def test_invalidated_after_commit(self):
+        self.get_narrower()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.a.narrower.add(self.c)
+            self.assertIsNotNone(cache.get(version_key(self.keyword_set.pk)))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(version_key(self.keyword_set.pk)))
+
+    def test_update_is_shown(self):
+        self.assertEqual(self.client.get('/api/keyword/').json()['count'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/keyword/{self.c.pk}/', {'name': 'd'}, format='json'
+            )
+        names = [
+            keyword['name']
+            for keyword in self.client.get('/api/keyword/').json()['results']
+        ]
+        self.assertIn('d', names)
+        self.assertEqual(
+            self.client.get(f'/api/keyword/{self.c.pk}/').json()['name'], 'd'
+        )
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_file_urls_follow_the_request_host(self):
+        Service.objects.create(name='s', fileUrl='doc.pdf')
+
+        def file_url(**extra):
+            response = self.client.get('/api/service/', **extra)
+            return response.json()['results'][0]['fileUrl']
+
+        self.assertEqual(
+            file_url(HTTP_HOST='a.example'), 'http://a.example/media/doc.pdf'
+        )
+        self.assertEqual(
+            file_url(HTTP_HOST='b.example'), 'http://b.example/media/doc.pdf'
+        )
+        self.assertEqual(
+            file_url(HTTP_HOST='b.example', secure=True),
+            'https://b.example/media/doc.pdf',
+        )
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_keyword('a')
+
+    def test_request_is_recorded(self):
+        labels = {'route': resolve('/api/keyword/').route, 'method': 'GET'}
+        requests = sample('http_requests_total', status='200', **labels)
+        queries = sample('http_request_sql_queries_sum', **labels)
+        self.assertEqual(self.client.get('/api/keyword/').status_code, 200)
+        self.assertEqual(
+            sample('http_requests_total', status='200', **labels), requests + 1
+        )
+        self.assertGreater(sample('http_request_sql_queries_sum', **labels), queries)
+
+    def test_unmatched_route(self):
+        labels = {'route': UNMATCHED_ROUTE, 'method': 'GET', 'status': '404'}
+        before = sample('http_requests_total', **labels)
+        self.client.get('/nope/1/')
+        self.client.get('/nope/2/')
+        self.assertEqual(sample('http_requests_total', **labels), before + 2)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total', response.content)
+
+    def test_exited_worker_is_archived(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                config = runpy.run_path(settings.BASE_DIR / 'gunicorn.conf.py')
+            for pid, value in ((1, 2.0), (2, 3.0)):
+                values = MmapedDict(os.path.join(directory, f'counter_{pid}.db'))
+                values.write_value('key', value, 0.0)
+                values.close()
+                config['archive_process_metrics'](directory, pid)
+            self.assertEqual(os.listdir(directory), ['counter_archive.db'])
+            archived = MmapedDict.read_all_values_from_file(
+                os.path.join(directory, 'counter_archive.db')
+            )
+            self.assertEqual(
+                [(key, value) for key, value, *_ in archived], [('key', 5.0)]
+            )
+
+
+class SlowQueryTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.listener = psycopg.connect(broker.conninfo(), autocommit=True)
+        self.addCleanup(self.listener.close)
+        self.listener.execute('LISTEN explained')
+        self.notifies = []
+        self.listener.add_notify_handler(self.notifies.append)
+
+    def test_side_effects_are_rolled_back(self):
+        plan = explain(
+            'default',
+            "SELECT pg_notify('explained', 'x'), set_config('app.explained', %s, false)",
+            ['yes'],
+        )
+        self.assertIn('Actual Rows', plan[0]['Plan'])
+        self.assertIn('Shared Hit Blocks', plan[0]['Plan'])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('app.explained', true)")
+            self.assertIn(cursor.fetchone()[0], ('', None))
+        self.listener.execute('SELECT 1')
+        self.assertEqual(self.notifies, [])
+
+    def test_writes_are_not_explained(self):
+        create_keyword('a')
+        self.assertIsNone(
+            explain('default', f'DELETE FROM {Keyword._meta.db_table}', None)
+        )
+        self.assertEqual(Keyword.objects.count(), 1)
+
+    def test_explained_in_background(self):
+        Explainer().submit('default', 'SELECT 1', None, {'plan': None})
+        deadline = time.monotonic() + 10
+        while not recorded_slow_queries() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        [entry] = recorded_slow_queries()
+        self.assertIn('Execution Time', entry['plan'][0])
@@ -1,3 +1,4 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from app.views import (
     LicenseViewSet,
@@ -11,7 +12,10 @@ from app.views import (
     CustomershipViewSet,
     KeywordViewSet,
     KeywordSetViewSet,
+    database_pool_stats,
+    slow_queries,
 )
+from app.stream import events
 
 router = DefaultRouter()
 router.register(r'application', ApplicationViewSet, basename='Application')
@@ -25,4 +29,8 @@ router.register(r'integration', IntegrationViewSet, basename='Integration')
 router.register(r'customership', CustomershipViewSet, basename='Customership')
 router.register(r'keyword', KeywordViewSet, basename='Keyword')
 router.register(r'keywordset', KeywordSetViewSet, basename='KeywordSet')
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('events/', events, name='events'),
+    path('db-pool/', database_pool_stats, name='db-pool'),
+    path('slow-queries/', slow_queries, name='slow-queries'),
+]
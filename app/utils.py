@@ -1,21 +1,30 @@
 from secrets import token_urlsafe
-from .exceptions import TokenGenerationException
 
 
-def generate_base_id(sender) -> str:
+def generate_base_id() -> str:
     """
-    Generate a unique secret to be used as base_id.
+    Generate a random secret to be used as base_id.
 
-    If this loop fails there may be too many instances in the DB or the generation
-    got extremely unlucky in which case consider raising the base_id length in the model with a higher urlsafe value.
+    The 64 random bits make collisions practically impossible, so no lookups are
+    made here. The unique constraints on base_id and base_token catch the rare
+    duplicate and BaseModel.save retries with a fresh token.
     """
-    for _ in range(1, 5):
-        token = token_urlsafe(8)
-        found = sender.objects.filter(base_token=token).first()
+    return token_urlsafe(8)
 
-        if not found:
-            return token
-    raise TokenGenerationException
+
+def assign_base_id(instance) -> None:
+    """Fill the generated id values of a new instance."""
+    token = generate_base_id()
+    instance.base_id = f"{instance.model_prefix}-{token}"
+    instance.base_token = token
+    instance.id_prefix = instance.model_prefix
+
+
+def is_base_id_conflict(error) -> bool:
+    """Whether an IntegrityError was raised by a duplicate base_id or base_token."""
+    diag = getattr(error.__cause__, 'diag', None)
+    constraint = getattr(diag, 'constraint_name', None) or ''
+    return constraint.endswith('_pkey') or 'base_token' in constraint
 
 
 def multi_receiver(signal, senders, **kwargs):
@@ -49,7 +58,13 @@ def query_param_validator(request, param):
     Specific parameters that need validation come here.
     '''
     if request:
-        if param == 'nested_max_count':
-            nested_max_count = is_valid_int(request.query_params.get(param, ''))
-            if nested_max_count is not None:
-                return nested_max_count
+        if param in ('nested_max_count', 'depth'):
+            value = is_valid_int(request.query_params.get(param, ''))
+            if value is not None:
+                return value
+
+        if param in ('fields', 'expand'):
+            # Comma separated field names, e.g. ?fields=base_id,name
+            names = request.query_params.get(param)
+            if names is not None:
+                return [name.strip() for name in names.split(',') if name.strip()]
@@ -1,4 +1,12 @@
-from rest_framework import viewsets
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
 from .models import (
     Customership,
@@ -11,6 +19,7 @@ from .models import (
     Integration,
     Contract,
     Keyword,
+    KeywordClosure,
     KeywordSet,
 )
 from .endpoints import (
@@ -36,147 +45,435 @@ from .endpoints import (
     KeywordSetSerializer,
     KeywordSetReadSerializer,
 )
-from .pagination import CustomPageNumberPagination
+from .async_views import AsyncViewSetMixin
+from .backends.postgresql_pool.base import pool_stats
+from .bulk import bulk_delete
+from .changes import change_feed
+from .conditional import (
+    add_validator_headers,
+    aobject_validators,
+    not_modified_response,
+    page_validators,
+)
+from .export import EXPORT_FORMATS, NDJSON, export_response
+from .graph import BOTH, DEFAULT_DEPTH, DIRECTIONS, MAX_DEPTH, dependency_graph
+from .impact import server_impact
+from .nested import NestedApplicationSerializer
+from .pagination import CustomPageNumberPagination, KeysetPagination
+from .prefetch import build_prefetch_plan
+from .representations import representation_versions
+from .slow_queries import recorded_slow_queries
+from .utils import query_param_validator
 
 from .filters import (
     FieldsFilter,
+    ModifiedSinceFilter,
 )
 
 
-class CommonViewSet(viewsets.ModelViewSet):
-    filter_backends = [FieldsFilter]
+class CommonViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
+    filter_backends = [FieldsFilter, ModifiedSinceFilter]
+    # Set to KeysetPagination to make cursor paging the default for a viewset.
     pagination_class = CustomPageNumberPagination
+    # Serializer used for GET requests, serializer_class for everything else.
+    read_serializer_class = None
+    prefetch_plan = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The select/prefetch plan is derived from the read serializer once, when
+        # the viewset class is created, instead of being maintained by hand.
+        if cls.read_serializer_class is not None:
+            cls.prefetch_plan = build_prefetch_plan(cls.read_serializer_class)
+        elif cls.serializer_class is not None:
+            cls.prefetch_plan = build_prefetch_plan(cls.serializer_class)
+
+    @property
+    def paginator(self):
+        """Switch to keyset pagination when the client sends a `cursor` parameter."""
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
 
-
-class CustomershipViewSet(CommonViewSet):
-    serializer_class = CustomershipSerializer
+    def get_serializer_class(self):
+        if self.read_serializer_class is not None and self.request.method in ['GET']:
+            return self.read_serializer_class
+        return self.serializer_class
 
     def get_queryset(self):
-        return Customership.objects.all().order_by('-last_modified_time')
+        queryset = super().get_queryset()
+        if self.request.method in ['GET']:
+            # Narrow the query to the ?fields= / ?expand= selection.
+            field_names = self.prefetch_plan.select(
+                fields=query_param_validator(request=self.request, param='fields'),
+                expand=query_param_validator(request=self.request, param='expand'),
+            )
+            # Relations are prefetched by CachedListSerializer, only for the
+            # objects whose representation is not cached.
+            queryset = self.prefetch_plan.narrow(queryset, field_names=field_names)
+        return queryset.order_by('-last_modified_time')
+
+    async def list(self, request, *args, **kwargs):
+        """List with an ETag of the page, answers 304 without serializing."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        objects = [obj async for obj in queryset] if page is None else page
+        versions = await sync_to_async(representation_versions)(
+            {obj.pk for obj in objects}
+        )
+        envelope = None
+        if page is not None:
+            envelope = self.get_paginated_response(None).data
+
+        validators = page_validators(request, envelope, objects, versions)
+        response = not_modified_response(request, validators)
+        if response is None:
+            # The serializer reuses the versions read for the validators.
+            serializer = self.get_serializer(
+                objects,
+                many=True,
+                context={
+                    **self.get_serializer_context(),
+                    'representation_versions': versions,
+                },
+            )
+            data = await serializer.ato_representation(objects)
+            if page is None:
+                response = Response(data)
+            else:
+                response = self.get_paginated_response(data)
+        return add_validator_headers(response, validators)
+
+    async def retrieve(self, request, *args, **kwargs):
+        """Detail with ETag/Last-Modified, answers 304 without serializing."""
+        validators = await aobject_validators(
+            request, self.queryset, self.kwargs[self.lookup_url_kwarg or 'pk']
+        )
+        if validators is None:
+            raise NotFound()
+        response = not_modified_response(request, validators)
+        if response is None:
+            instance = await self.aget_object()
+            # Rendered as a list of one to go through the representation cache.
+            serializer = self.get_serializer([instance], many=True)
+            response = Response((await serializer.ato_representation([instance]))[0])
+        return add_validator_headers(response, validators)
+
+    def create(self, request, *args, **kwargs):
+        """Create one object, or many from a list with a fixed number of queries."""
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            instances = serializer.save()
+        return Response(
+            self.bulk_response_data(instances), status=status.HTTP_201_CREATED
+        )
 
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream the whole filtered collection without paging, one object per line.
+
+        Takes the same filters and ?fields= / ?expand= as the list.
+
+        Examples:
+        1) {endpoint}/export/
+        2) {endpoint}/export/?output=csv&fields=base_id,name
+        """
+        output = request.query_params.get('output', NDJSON)
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(
+                f"output must be one of {', '.join(EXPORT_FORMATS)}, not {output}"
+            )
+        return export_response(
+            request._request,
+            self.get_serializer([], many=True),
+            self.filter_queryset(self.get_queryset()),
+            output=output,
+            chunk_size=settings.EXPORT_CHUNK_SIZE,
+            filename=self.queryset.model._meta.model_name,
+        )
 
-class ProviderViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return ProviderReadSerializer
-        return ProviderSerializer
+    @action(detail=False, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        """
+        Objects modified and deleted since a position, oldest first.
+
+        Start with ?modified_since= (or nothing for everything), then pass the
+        returned `cursor` until `more` is false, and keep the last cursor for
+        the next sync.
+
+        Examples:
+        1) {endpoint}/changes/?modified_since=2023-05-01T12:00:00Z
+        2) {endpoint}/changes/?cursor=<cursor>&count=500
+        """
+        return Response(
+            change_feed(
+                request,
+                self.get_queryset(),
+                self.get_serializer([], many=True),
+            )
+        )
 
-    def get_queryset(self):
-        return Provider.objects.prefetch_related(
-            'related_services',
-            'related_applications',
-            'related_contracts',
-        ).order_by('-last_modified_time')
+    @action(detail=False, methods=['patch'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Partially update many objects at once.
+
+        Takes a list of objects that each carry their base_id, e.g.
+        [{"base_id": "app-...", "name": "new name"}, ...]
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError('Expected a list of objects.')
+
+        base_ids = [
+            item.get('base_id') if isinstance(item, dict) else None
+            for item in request.data
+        ]
+        instances = self.get_bulk_objects(base_ids)
+        serializer = self.get_serializer(
+            instances, data=request.data, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            instances = serializer.save()
+        return Response(self.bulk_response_data(instances))
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        """Delete many objects at once, takes a list of base_ids."""
+        if not isinstance(request.data, list):
+            raise ValidationError('Expected a list of base_ids.')
+
+        bulk_delete(self.queryset.model, self.get_bulk_objects(request.data))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_bulk_objects(self, base_ids):
+        """Fetch the objects of a bulk request in one query, in request order."""
+        if not all(isinstance(base_id, str) for base_id in base_ids):
+            raise ValidationError('Every object needs a base_id.')
+        if len(set(base_ids)) != len(base_ids):
+            raise ValidationError('Duplicate base_id in request.')
+
+        objects = self.queryset.model.objects.in_bulk(base_ids)
+        missing = [base_id for base_id in base_ids if base_id not in objects]
+        if missing:
+            raise NotFound(f"Not found: {', '.join(missing)}")
+        return [objects[base_id] for base_id in base_ids]
+
+    def bulk_response_data(self, instances):
+        """Render written objects, re-read with the prefetch plan of the serializer."""
+        serializer_class = self.get_serializer_class()
+        queryset = build_prefetch_plan(serializer_class).apply(
+            self.queryset.model.objects.filter(
+                pk__in=[instance.pk for instance in instances]
+            )
+        )
+        objects = queryset.in_bulk()
+        return serializer_class(
+            [objects[instance.pk] for instance in instances],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+
+
+class DependencyGraphMixin:
+    """Adds the transitive dependency graph of an object to a viewset."""
+
+    @action(detail=True, methods=['get'])
+    def dependencies(self, request, pk=None):
+        """
+        Everything the object depends on (upstream) and everything that depends
+        on it (downstream), walked up to `depth` hops in one query. The
+        application_dependency and related_services links are symmetrical and
+        show up in both directions.
+
+        Examples:
+        1) {endpoint}/{base_id}/dependencies/
+        2) {endpoint}/{base_id}/dependencies/?direction=downstream&depth=10
+        """
+        direction = request.query_params.get('direction', BOTH)
+        if direction not in DIRECTIONS:
+            raise ValidationError(
+                f"direction must be one of {', '.join(DIRECTIONS)}, not {direction}"
+            )
+        depth = query_param_validator(request=request, param='depth')
+        depth = DEFAULT_DEPTH if depth is None else min(depth, MAX_DEPTH)
+
+        graph = dependency_graph(pk, direction=direction, depth=depth)
+        if graph is None or graph['id_prefix'] != self.queryset.model.model_prefix:
+            raise NotFound()
+        return Response(graph)
 
 
-class LicenseViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return LicenseReadSerializer
-        return LicenseSerializer
+class CustomershipViewSet(CommonViewSet):
+    queryset = Customership.objects.all()
+    serializer_class = CustomershipSerializer
 
-    def get_queryset(self):
-        return License.objects.prefetch_related('contract').order_by(
-            '-last_modified_time'
-        )
 
+class ProviderViewSet(CommonViewSet):
+    queryset = Provider.objects.all()
+    serializer_class = ProviderSerializer
+    read_serializer_class = ProviderReadSerializer
 
-class ApplicationViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return ApplicationReadSerializer
-        return ApplicationSerializer
 
-    def get_queryset(self):
-        return Application.objects.prefetch_related(
-            'contract',
-            'license',
-            'installed_server',
-            'application_dependency',
-            'service_dependency',
-            'integration',
-        ).order_by('-last_modified_time')
+class LicenseViewSet(CommonViewSet):
+    queryset = License.objects.all()
+    serializer_class = LicenseSerializer
+    read_serializer_class = LicenseReadSerializer
 
 
-class ServiceViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return ServiceReadSerializer
-        return ServiceSerializer
+class ApplicationViewSet(DependencyGraphMixin, CommonViewSet):
+    queryset = Application.objects.all()
+    serializer_class = ApplicationSerializer
+    read_serializer_class = ApplicationReadSerializer
 
-    def get_queryset(self):
-        return Service.objects.prefetch_related(
-            'contract', 'related_services', 'required_installations', 'provider'
-        ).order_by('-last_modified_time')
 
+class ServiceViewSet(DependencyGraphMixin, CommonViewSet):
+    queryset = Service.objects.all()
+    serializer_class = ServiceSerializer
+    read_serializer_class = ServiceReadSerializer
 
-class ServerViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return ServerReadSerializer
-        return ServerSerializer
 
-    def get_queryset(self):
-        return Server.objects.prefetch_related('applications').order_by(
-            '-last_modified_time'
-        )
+class ServerViewSet(CommonViewSet):
+    queryset = Server.objects.all()
+    serializer_class = ServerSerializer
+    read_serializer_class = ServerReadSerializer
+
+    @action(detail=True, methods=['get'])
+    def impact(self, request, pk=None):
+        """
+        Applications installed on the server, the services that require them and
+        the customerships of all of these.
+        """
+        report = server_impact([pk]).get(pk)
+        if report is None:
+            raise NotFound()
+        return Response(report)
+
+    @action(detail=False, methods=['post'], url_path='impact')
+    def batch_impact(self, request):
+        """Impact reports of many servers, takes a list of server base_ids."""
+        if not isinstance(request.data, list) or not all(
+            isinstance(base_id, str) for base_id in request.data
+        ):
+            raise ValidationError('Expected a list of base_ids.')
+
+        server_ids = list(dict.fromkeys(request.data))
+        reports = server_impact(server_ids)
+        missing = [server_id for server_id in server_ids if server_id not in reports]
+        if missing:
+            raise NotFound(f"Not found: {', '.join(missing)}")
+        return Response([reports[server_id] for server_id in server_ids])
 
 
 class DirectoryViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return DirectoryReadSerializer
-        return DirectorySerializer
-
-    def get_queryset(self):
-        return Directory.objects.prefetch_related(
-            'applications', 'services', 'servers'
-        ).order_by('-last_modified_time')
+    queryset = Directory.objects.all()
+    serializer_class = DirectorySerializer
+    read_serializer_class = DirectoryReadSerializer
 
 
 class ContractViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return ContractReadSerializer
-        return ContractSerializer
-
-    def get_queryset(self):
-        return Contract.objects.prefetch_related('related_applications').order_by(
-            '-last_modified_time'
-        )
+    queryset = Contract.objects.all()
+    serializer_class = ContractSerializer
+    read_serializer_class = ContractReadSerializer
 
 
 class IntegrationViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return IntegrationReadSerializer
-        return IntegrationSerializer
-
-    def get_queryset(self):
-        return Integration.objects.prefetch_related('server_platform').order_by(
-            '-last_modified_time'
-        )
+    queryset = Integration.objects.all()
+    serializer_class = IntegrationSerializer
+    read_serializer_class = IntegrationReadSerializer
 
 
 class KeywordViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return KeywordReadSerializer
-        return KeywordSerializer
-
-    def get_queryset(self):
-        return Keyword.objects.prefetch_related('broader', 'narrower').order_by(
+    queryset = Keyword.objects.all()
+    serializer_class = KeywordSerializer
+    read_serializer_class = KeywordReadSerializer
+
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """
+        All narrower concepts of the keyword, at any depth.
+
+        Examples:
+        1) {endpoint}/{base_id}/subtree/
+        2) {endpoint}/{base_id}/subtree/?depth=2
+        """
+        return Response(self.closure_keywords(pk, narrower=True))
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """All broader concepts of the keyword, at any depth."""
+        return Response(self.closure_keywords(pk, narrower=False))
+
+    @action(detail=True, methods=['get'])
+    def applications(self, request, pk=None):
+        """Applications tagged with the keyword or any of its narrower concepts."""
+        if not Keyword.objects.filter(pk=pk).exists():
+            raise NotFound()
+
+        narrower = KeywordClosure.objects.filter(ancestor=pk).values('descendant')
+        tagged = Application.keywords.through.objects.filter(
+            Q(keyword_id=pk) | Q(keyword_id__in=narrower)
+        ).values('application_id')
+        queryset = Application.objects.filter(pk__in=tagged).order_by(
             '-last_modified_time'
         )
 
+        page = self.paginate_queryset(queryset)
+        serializer = NestedApplicationSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def closure_keywords(self, pk, narrower):
+        """Keywords below (narrower) or above the given one, read from the closure."""
+        if not Keyword.objects.filter(pk=pk).exists():
+            raise NotFound()
+
+        if narrower:
+            rows = KeywordClosure.objects.filter(ancestor=pk)
+            other, own = 'descendant', 'ancestor'
+        else:
+            rows = KeywordClosure.objects.filter(descendant=pk)
+            other, own = 'ancestor', 'descendant'
+        depth = query_param_validator(request=self.request, param='depth')
+        if depth is not None:
+            rows = rows.filter(depth__lte=depth)
+
+        return list(
+            Keyword.objects.filter(pk__in=rows.values(other))
+            .annotate(
+                depth=Subquery(
+                    KeywordClosure.objects.filter(
+                        **{own: pk, other: OuterRef('pk')}
+                    ).values('depth')
+                )
+            )
+            .order_by('depth', 'name')
+            .values('base_id', 'id_prefix', 'name', 'depth')
+        )
+
 
 class KeywordSetViewSet(CommonViewSet):
-    def get_serializer_class(self):
-        if self.request.method in ['GET']:
-            return KeywordSetReadSerializer
-        return KeywordSetSerializer
+    queryset = KeywordSet.objects.all()
+    serializer_class = KeywordSetSerializer
+    read_serializer_class = KeywordSetReadSerializer
 
-    def get_queryset(self):
-        return KeywordSet.objects.prefetch_related('keywords').order_by(
-            '-last_modified_time'
-        )
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def database_pool_stats(request):
+    """Connection pool statistics of the process that serves the request."""
+    return Response(pool_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def slow_queries(request):
+    """The recorded slow queries of all processes, newest first."""
+    return Response(recorded_slow_queries())
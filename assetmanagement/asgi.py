@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'assetmanagement.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from app.stream import with_receive_channel  # noqa: E402
+
+# The event stream reads client disconnects from the receive channel.
+application = with_receive_channel(django_application)
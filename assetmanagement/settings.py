@@ -15,11 +15,14 @@ import environ
 import os
 
 CONFIG_FILE_NAME = "config_dev.env"
+PRODUCTION_SETTINGS_MODULE = 'assetmanagement.settings_production'
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-environ.Env.read_env(os.path.join(BASE_DIR, CONFIG_FILE_NAME))
+# The production settings are configured from the environment only.
+if os.environ.get('DJANGO_SETTINGS_MODULE') != PRODUCTION_SETTINGS_MODULE:
+    environ.Env.read_env(os.path.join(BASE_DIR, CONFIG_FILE_NAME))
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
@@ -48,18 +51,23 @@ INSTALLED_APPS = [
     'app',
     'django_filters',
     'corsheaders',
-    'debug_toolbar',
 ]
 
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 100,
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'app.metrics.MetricsMiddleware',
+    'app.middleware.CompressionMiddleware',
+    'app.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -94,17 +102,103 @@ WSGI_APPLICATION = 'assetmanagement.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Minimum trigram similarity for FieldsFilter matches, set per database session.
+TRIGRAM_SIMILARITY_THRESHOLD = 0.1
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql with connections from a psycopg_pool.
+        'ENGINE': 'app.backends.postgresql_pool',
         'NAME': os.environ.get('POSTGRES_NAME'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        # Per process, see psycopg_pool.ConnectionPool.
+        'POOL': {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            # Seconds a request waits for a free connection before failing.
+            'timeout': env.float('DB_POOL_TIMEOUT', default=10.0),
+            'max_idle': 300,
+            'max_lifetime': 3600,
+        },
+        # Set once on every new connection of the pool.
+        'SESSION_PARAMETERS': {
+            'pg_trgm.similarity_threshold': str(TRIGRAM_SIMILARITY_THRESHOLD),
+        },
     }
 }
 
+# Read replicas as host[:port], with the name and credentials of the default
+# database, e.g. DATABASE_REPLICAS=db-replica,db-replica-2:5433
+for number, replica in enumerate(env.list('DATABASE_REPLICAS', default=[]), 1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': int(port or 5432),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+
+# Replicas lagging more than this many seconds get no reads.
+REPLICA_MAX_LAG = env.float('REPLICA_MAX_LAG', default=5.0)
+# Seconds between replica lag measurements, per process.
+REPLICA_LAG_CHECK_INTERVAL = 5
+# Seconds a lag measurement waits for a replica connection.
+REPLICA_CONNECT_TIMEOUT = 2
+# Seconds a client reads from the primary after it wrote.
+PRIMARY_PIN_SECONDS = 10
+
+# Rows per INSERT/UPDATE statement in the bulk endpoints and importers.
+BULK_BATCH_SIZE = 1000
+
+# Seconds a server impact report is cached, reports are invalidated on changes.
+IMPACT_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a serialized object is cached, entries are invalidated on changes.
+REPRESENTATION_CACHE_TIMEOUT = 60 * 60
+
+# Local memory by default, which is per process. Set CACHE_URL to a shared
+# backend, e.g. redis://localhost:6379/0, when running several.
+CACHES = {'default': env.cache('CACHE_URL', default='locmemcache://')}
+
+# Objects per server-side cursor fetch and prefetch batch in the export endpoints.
+EXPORT_CHUNK_SIZE = 2000
+
+# The change feeds hold back changes younger than this many seconds, so that
+# transactions still in flight cannot commit rows behind a returned cursor. On
+# PostgreSQL they also stop at the start of the oldest open transaction that
+# has written. Elsewhere a transaction open for longer can still be missed.
+CHANGE_FEED_SAFETY_LAG = env.float('CHANGE_FEED_SAFETY_LAG', default=5.0)
+
+# Days deletions are kept for the change feeds, see `manage.py prune_tombstones`.
+TOMBSTONE_RETENTION_DAYS = 90
+
+# NOTIFY channel of the create/update/delete events streamed by /api/events/.
+EVENTS_CHANNEL = 'asset_events'
+# Events buffered per event stream client before it is told to resync.
+EVENTS_QUEUE_SIZE = 1000
+# Seconds between keepalive comments on idle event streams.
+EVENTS_KEEPALIVE = 15
+
+# Responses smaller than this many bytes are not compressed.
+COMPRESSION_MIN_SIZE = 1024
+
+# Bearer token the metrics endpoint asks for, open when empty.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Queries taking at least this many seconds are logged and kept for staff at
+# /api/slow-queries/, off when unset. A sampled fraction of the SELECTs is run
+# again with EXPLAIN (ANALYZE, BUFFERS) in a background thread, in a transaction
+# that is rolled back.
+SLOW_QUERY_THRESHOLD = env.float('SLOW_QUERY_THRESHOLD', default=None)
+SLOW_QUERY_EXPLAIN_RATE = env.float('SLOW_QUERY_EXPLAIN_RATE', default=0.1)
+# Number of slow queries kept, the oldest are dropped.
+SLOW_QUERY_BUFFER_SIZE = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -152,10 +246,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT = '/media/'
 MEDIA_URL = '/media/'
 
-hostname, _, ips = socket.gethostbyname_ex(socket.gethostname())
-INTERNAL_IPS = [
-    ip[: ip.rfind(".")] + ".1" for ip in ips] + ["127.0.0.1", "10.0.2.2"]
 
+class InternalIPs:
+    """
+    INTERNAL_IPS that resolve the host's addresses on first use instead of at
+    import time: the Docker gateways of this host, the loopback address and the
+    VirtualBox host.
+    """
+
+    def __init__(self):
+        self.ips = None
+
+    def resolve(self):
+        if self.ips is None:
+            _, _, ips = socket.gethostbyname_ex(socket.gethostname())
+            self.ips = [ip[: ip.rfind('.')] + '.1' for ip in ips] + [
+                '127.0.0.1',
+                '10.0.2.2',
+            ]
+        return self.ips
+
+    def __contains__(self, ip):
+        return ip in self.resolve()
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+
+INTERNAL_IPS = InternalIPs()
+
+# The debug toolbar is only loaded for development.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    # Inside the compression, which would hide the page from the toolbar.
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('app.middleware.CompressionMiddleware') + 1,
+        'debug_toolbar.middleware.DebugToolbarMiddleware',
+    )
 
 DEBUG_TOOLBAR_CONFIG = {
     'SHOW_TOOLBAR_CALLBACK': lambda _request: DEBUG
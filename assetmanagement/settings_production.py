@@ -0,0 +1,82 @@
+"""
+Production settings: the development settings without the debug-only apps,
+middleware and renderers.
+
+Run with DJANGO_SETTINGS_MODULE=assetmanagement.settings_production behind
+gunicorn, see gunicorn.conf.py. config_dev.env is not read, SECRET_KEY,
+ALLOWED_HOSTS, CACHE_URL and METRICS_TOKEN have to be set in the environment.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import (
+    CACHES,
+    DATABASES,
+    INSTALLED_APPS,
+    MIDDLEWARE,
+    REST_FRAMEWORK,
+    env,
+)
+
+DEBUG = False
+
+# The metrics endpoint is open without METRICS_TOKEN.
+for name in ('SECRET_KEY', 'ALLOWED_HOSTS', 'CACHE_URL', 'METRICS_TOKEN'):
+    if not os.environ.get(name):
+        raise ImproperlyConfigured(f'Set the {name} environment variable.')
+
+# The representation, impact and slow query caches and the version tokens
+# are shared by the workers. They hold an entry per object of the estate: the
+# local memory cache is per process and the file cache lists its directory on
+# every write once it is full.
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+if CACHES['default']['BACKEND'] not in SHARED_CACHE_BACKENDS:
+    raise ImproperlyConfigured('CACHE_URL must name a redis or memcached cache.')
+
+# Every worker has its own connection pools and a LISTEN connection for the
+# event stream. The WEB_CONCURRENCY workers, set by gunicorn.conf.py, share
+# DB_MAX_CONNECTIONS connections per database server, i.e. max_connections
+# less a reserve for migrations, management commands and administration.
+WORKERS = env.int('WEB_CONCURRENCY', default=1)
+DB_MAX_CONNECTIONS = env.int('DB_MAX_CONNECTIONS', default=80)
+POOL_MAX_SIZE = DB_MAX_CONNECTIONS // WORKERS - 1
+if POOL_MAX_SIZE < 1:
+    raise ImproperlyConfigured(
+        f'DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS} leaves no connections for '
+        f'the pools of {WORKERS} workers.'
+    )
+for database in DATABASES.values():
+    database['POOL'] = {
+        **database['POOL'],
+        'min_size': min(database['POOL']['min_size'], POOL_MAX_SIZE),
+        'max_size': POOL_MAX_SIZE,
+    }
+
+# Connections and requests a worker takes on before uvicorn answers 503 at once,
+# see assetmanagement.workers. Requests beyond the pool size wait up to the
+# pool timeout for a connection, this bounds how many do. Idle keep-alive
+# connections and event streams count as well.
+WEB_LIMIT_CONCURRENCY = env.int('WEB_LIMIT_CONCURRENCY', default=4 * POOL_MAX_SIZE)
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+MIDDLEWARE = [
+    middleware
+    for middleware in MIDDLEWARE
+    if middleware != 'debug_toolbar.middleware.DebugToolbarMiddleware'
+]
+
+# Only JSON; the browsable API renders a full HTML page with forms per request.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['app.renderers.FastJSONRenderer'],
+}
+
+# Not looked up outside of DEBUG.
+INTERNAL_IPS = []
@@ -0,0 +1,17 @@
+"""
+Gunicorn worker of the production server, see gunicorn.conf.py.
+"""
+
+from django.conf import settings
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Uvicorn worker that answers 503 once WEB_LIMIT_CONCURRENCY connections and
+    requests are open, rather than queueing them on the connection pools.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.limit_concurrency = settings.WEB_LIMIT_CONCURRENCY
@@ -0,0 +1,4 @@
+#!/bin/sh
+# Lets the db-replica service stream WAL from this database. Runs once, when
+# the data directory is initialized.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,94 @@
+"""
+Gunicorn configuration of the production server.
+
+    gunicorn assetmanagement.asgi:application -c gunicorn.conf.py
+
+Uvicorn workers serve the ASGI application, so the event stream runs next to
+the API. WEB_CONCURRENCY and PORT override the defaults. The production settings
+size the connection pools and WEB_LIMIT_CONCURRENCY, the open connections and
+requests per worker, from WEB_CONCURRENCY.
+"""
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# The workers write their metrics here and /metrics sums them. Set before the
+# application, and with it prometheus_client, is loaded.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus')
+)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# The production settings size the connection pools of each worker by it.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'assetmanagement.workers.UvicornWorker'
+
+# Import Django once in the master, the workers are forked with it loaded. The
+# connection pools are per process and opened by each worker on first use.
+preload_app = True
+# Recycle workers now and then against slow memory growth.
+max_requests = 2000
+max_requests_jitter = 200
+# The event stream keeps connections open, its keepalives are sent well inside this.
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Drop the metrics files of a previous run."""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+
+def archive_process_metrics(directory, pid):
+    """
+    Add the counters and histograms of an exited worker to the archive files
+    and remove its own, so that the directory does not grow with every worker
+    max_requests recycles.
+    """
+    # Not public API, requirements.txt pins prometheus_client for it.
+    from prometheus_client.mmap_dict import MmapedDict
+
+    for kind in ('counter', 'histogram'):
+        path = os.path.join(directory, f'{kind}_{pid}.db')
+        if not os.path.exists(path):
+            continue
+        archive = os.path.join(directory, f'{kind}_archive.db')
+        totals = {}
+        for source in (archive, path):
+            if os.path.exists(source):
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(
+                    source
+                ):
+                    totals[key] = totals.get(key, 0.0) + value
+        partial = f'{archive}.partial'
+        if os.path.exists(partial):
+            # Left over from an interrupted merge.
+            os.remove(partial)
+        merged = MmapedDict(partial)
+        try:
+            for key, value in totals.items():
+                merged.write_value(key, value, 0.0)
+        finally:
+            merged.close()
+        # Rename after the writes, a scrape sees either the old or the new archive.
+        os.replace(partial, archive)
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """Fold the counters of an exited worker into the archive, drop its live gauges."""
+    from prometheus_client import multiprocess
+
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    multiprocess.mark_process_dead(worker.pid, directory)
+    archive_process_metrics(directory, worker.pid)